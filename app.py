@@ -5,16 +5,27 @@ PDF转Markdown Web应用
 基于FastAPI构建的Web界面
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import HTMLResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
-import fitz  # pymupdf
+import asyncio
 import re
 import os
 import tempfile
 from pathlib import Path
 import pandas as pd
 from datetime import datetime
+from urllib.parse import quote, urlencode
+
+from pdf_to_markdown import detect_headings, clean_markdown
+from doc_cache import DocumentPoolProcess, compute_document_id, parse_page_ranges
+from storage import ConversionStorage, StorageSweeper
+from profiling import write_profile_report
+from document_tree import RENDERERS, parse_formats
+from heading_rules import parse_rule_packs
+from conversion_limits import (
+    ConversionError, ConversionLimits, ConversionLimitExceeded, NoTextError, convert_with_limits, limit_metrics
+)
 
 app = FastAPI(title="PDFMark - PDF转Markdown工具", description="PDFMark - PDF转Markdown工具", version="1.0.0")
 
@@ -22,62 +33,74 @@ app = FastAPI(title="PDFMark - PDF转Markdown工具", description="PDFMark - PDF
 os.makedirs("static", exist_ok=True)
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("outputs", exist_ok=True)
+os.makedirs("uploads/cache", exist_ok=True)
 
-def extract_text_with_pymupdf(pdf_path):
-    """使用PyMuPDF提取PDF文本"""
-    doc = fitz.open(pdf_path)
-    full_text = ""
-    
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        text = page.get_text()
-        full_text += f"\n<!-- 第{page_num + 1}页 -->\n"
-        full_text += text + "\n"
-    
-    doc.close()
-    return full_text
+# 任务目录与按内容寻址的输出存储
+storage = ConversionStorage("uploads", "outputs")
 
-def detect_headings(text):
-    """检测标题层级"""
-    lines = text.split('\n')
-    processed_lines = []
-    
-    for line in lines:
-        if not line.strip():
-            processed_lines.append(line)
-            continue
-            
-        # 检测数字编号标题
-        if re.match(r'^\d+(\.\d+)*\.?\s+', line):
-            level = line.count('.') + 1
-            if level > 6:
-                level = 6
-            heading = '#' * level + ' ' + line
-            processed_lines.append(heading)
-        
-        # 检测中文编号
-        elif re.match(r'^[一二三四五六七八九十]+、', line):
-            processed_lines.append('# ' + line)
-        
-        # 检测括号编号
-        elif re.match(r'^\([一二三四五六七八九十\d]+\)', line):
-            processed_lines.append('## ' + line)
-        
-        # 检测标题特征
-        elif len(line) < 50 and (line.isupper() or '第' in line and '章' in line):
-            processed_lines.append('# ' + line)
-        
-        else:
-            processed_lines.append(line)
-    
-    return '\n'.join(processed_lines)
+# 输出与上传缓存的保留时间和磁盘配额
+OUTPUT_TTL_SECONDS = 7 * 24 * 3600
+OUTPUT_QUOTA_BYTES = 1024 * 1024 * 1024
+JOB_TTL_SECONDS = 3600
+UPLOAD_CACHE_TTL_SECONDS = 24 * 3600
+UPLOAD_CACHE_QUOTA_BYTES = 1024 * 1024 * 1024
+
+storage_sweeper = StorageSweeper([
+    ("outputs", OUTPUT_TTL_SECONDS, OUTPUT_QUOTA_BYTES),
+    ("uploads/jobs", JOB_TTL_SECONDS, None),
+    ("uploads/cache", UPLOAD_CACHE_TTL_SECONDS, UPLOAD_CACHE_QUOTA_BYTES),
+])
+
+# 单次转换的资源限制：超时、最大页数、内存上限
+conversion_limits = ConversionLimits(
+    timeout_seconds=120,
+    max_pages=2000,
+    max_memory_bytes=2 * 1024 * 1024 * 1024,
+)
+
+# 按页码范围转换时单次打开或提取文本的超时时间（秒）
+PAGE_CALL_TIMEOUT_SECONDS = 30
+
+# 已打开文档句柄与页面文本的LRU缓存，供按页码范围转换复用；
+# 运行在独立子进程中，与整文档转换共用内存上限，单次调用受超时约束
+document_pool = DocumentPoolProcess(conversion_limits, call_timeout=PAGE_CALL_TIMEOUT_SECONDS)
+
+def markdown_header(source, converted=None):
+    """Markdown文档头部：标题、原文件名与转换时间"""
+    lines = [f"# {Path(source).stem}", "", "> 本文档由PDF自动转换生成", f"> 原文件：{source}"]
+    if converted:
+        lines.append(f"> 转换时间：{converted}")
+    return "\n".join(lines) + "\n\n---\n\n"
+
+def save_conversion_outputs(outputs, filename):
+    """
+    保存一次转换得到的各格式结果
 
-def clean_markdown(text):
-    """清理和优化Markdown格式"""
-    text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
-    text = re.sub(r'(\n#{1,6}\s+.*)\n(?!\n)', r'\1\n\n', text)
-    text = re.sub(r'(?<!\n)\n(#{1,6}\s+.*)', r'\n\n\1', text)
-    return text
+    输出文件按正文内容寻址，只保存正文；Markdown的文档头部（原文件名、转换时间）
+    写入下载链接的查询参数，由 /download 在下载时添加，相同的转换结果只存储一份。
+
+    参数:
+        outputs: {格式名: 内容}
+        filename: 上传的原始文件名
+    返回:
+        {格式名: {"filename": 输出文件ID, "download_name": 下载文件名, "download_url": 下载链接}}
+    """
+    pdf_name = Path(filename).stem
+    converted = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    saved = {}
+    for name, body in outputs.items():
+        extension = RENDERERS[name][1]
+        output_id = storage.store_output(body, extension)
+        download_name = f"{pdf_name}{extension}"
+        params = {"name": download_name}
+        if name == "markdown":
+            params.update(source=filename, converted=converted)
+        saved[name] = {
+            "filename": output_id,
+            "download_name": download_name,
+            "download_url": f"/download/{output_id}?{urlencode(params)}",
+        }
+    return saved
 
 @app.get("/", response_class=HTMLResponse)
 async def main():
@@ -347,7 +370,7 @@ async def main():
                         resultDiv.className = 'result success';
                         resultDiv.innerHTML = `
                             ✅ 转换成功！<br>
-                            <a href="/download/${result.filename}" download style="color: #007bff; text-decoration: none;">
+                            <a href="${result.download_url}" download style="color: #007bff; text-decoration: none;">
                                 📥 下载Markdown文件
                             </a>
                         `;
@@ -458,8 +481,8 @@ async def main():
                                 resultHtml += `
                                     <div class="batch-item batch-success">
                                         📄 ${item.filename} → 
-                                        <a href="/download/${item.output_filename}" download style="color: #007bff; text-decoration: none;">
-                                            📥 ${item.output_filename}
+                                        <a href="${item.download_url}" download style="color: #007bff; text-decoration: none;">
+                                            📥 ${item.download_name}
                                         </a>
                                     </div>
                                 `;
@@ -503,62 +526,82 @@ async def main():
     return html_content
 
 @app.post("/convert")
-async def convert_pdf(file: UploadFile = File(...)):
-    """转换单个PDF为Markdown"""
+async def convert_pdf(request: Request, file: UploadFile = File(...), profile: bool = False,
+                      formats: str = None, rules: str = None):
+    """
+    转换单个PDF为Markdown
+    查询参数 formats 指定输出格式（如 "markdown,html,json,text"），多种格式共用一次解析；
+    查询参数 rules 指定标题规则包（如 "zh,legal"），默认根据文本自动选择；
+    查询参数 profile=true 或请求头 X-Profile: 1 开启性能分析，报告与结果一同保存
+    """
+    profile = profile or request.headers.get("X-Profile", "").lower() in ("1", "true", "yes")
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="请上传PDF文件")
+    try:
+        format_list = parse_formats(formats)
+        rule_packs = parse_rule_packs(rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
+    job_dir = None
     try:
-        # 保存上传的文件
-        upload_path = f"uploads/{file.filename}"
-        with open(upload_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # 提取文本
-        text = extract_text_with_pymupdf(upload_path)
+        # 保存上传的文件到独立的任务目录
+        content = await file.read()
+        job_dir, upload_path = storage.save_upload(content)
         
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="PDF文件无法提取文本内容")
+        # 在受限子进程中提取文本并转换为指定格式
+        result = await asyncio.to_thread(
+            convert_with_limits, upload_path, conversion_limits, file.filename, profile,
+            format_list, Path(file.filename).stem, rule_packs
+        )
+        profile_report = result["profile"]
         
-        # 转换为Markdown
-        markdown_text = detect_headings(text)
-        markdown_text = clean_markdown(markdown_text)
+        # 保存各格式结果（按内容寻址）
+        saved = save_conversion_outputs(result["outputs"], file.filename)
+        primary = saved[format_list[0]]
+        output_filename = primary["filename"]
+        response = {
+            "message": "转换成功",
+            "filename": output_filename,
+            "download_name": primary["download_name"],
+            "download_url": primary["download_url"],
+            "outputs": saved
+        }
         
-        # 添加文档头部
-        pdf_name = Path(file.filename).stem
-        header = f"""# {pdf_name}
-
-> 本文档由PDF自动转换生成
-> 原文件：{file.filename}
-> 转换时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
----
-
-"""
-        
-        markdown_text = header + markdown_text
-        
-        # 保存Markdown文件
-        output_filename = f"{pdf_name}.md"
-        output_path = f"outputs/{output_filename}"
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(markdown_text)
-        
-        # 清理上传的PDF文件
-        os.remove(upload_path)
+        # 保存性能分析报告（文件名附加任务ID，输出相同的多次请求不会互相覆盖报告）
+        if profile:
+            job_id = os.path.basename(job_dir)
+            base_path = f"{os.path.splitext(storage.output_path(output_filename))[0]}.{job_id}"
+            report_paths = write_profile_report(profile_report, base_path)
+            response["profile_files"] = [os.path.basename(path) for path in report_paths]
+            response["profile_summary"] = {
+                key: profile_report["summary"][key]
+                for key in ("total_seconds", "page_count", "extract_seconds", "slowest_pages")
+            }
         
-        return {"message": "转换成功", "filename": output_filename}
+        return response
         
+    except NoTextError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConversionLimitExceeded as e:
+        raise HTTPException(status_code=422, detail=f"转换超出资源限制: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"转换过程中出现错误: {str(e)}")
+    finally:
+        # 清理上传的PDF文件
+        if job_dir is not None:
+            storage.remove_job_dir(job_dir)
 
 @app.post("/convert-batch")
-async def convert_pdfs_batch(files: list[UploadFile] = File(...)):
-    """批量转换PDF为Markdown"""
+async def convert_pdfs_batch(files: list[UploadFile] = File(...), formats: str = None, rules: str = None):
+    """批量转换PDF为Markdown，查询参数 formats 指定输出格式，rules 指定标题规则包"""
     if not files:
         raise HTTPException(status_code=400, detail="请选择要转换的PDF文件")
+    try:
+        format_list = parse_formats(formats)
+        rule_packs = parse_rule_packs(rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     results = []
     failed_files = []
@@ -568,61 +611,39 @@ async def convert_pdfs_batch(files: list[UploadFile] = File(...)):
             failed_files.append({"filename": file.filename, "error": "不是PDF文件"})
             continue
         
+        job_dir = None
         try:
-            # 保存上传的文件
-            upload_path = f"uploads/{file.filename}"
-            with open(upload_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            
-            # 提取文本
-            text = extract_text_with_pymupdf(upload_path)
-            
-            if not text.strip():
-                failed_files.append({"filename": file.filename, "error": "PDF文件无法提取文本内容"})
-                os.remove(upload_path)
-                continue
-            
-            # 转换为Markdown
-            markdown_text = detect_headings(text)
-            markdown_text = clean_markdown(markdown_text)
-            
-            # 添加文档头部
-            pdf_name = Path(file.filename).stem
-            header = f"""# {pdf_name}
-
-> 本文档由PDF自动转换生成
-> 原文件：{file.filename}
-> 转换时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
----
-
-"""
-            
-            markdown_text = header + markdown_text
-            
-            # 保存Markdown文件
-            output_filename = f"{pdf_name}.md"
-            output_path = f"outputs/{output_filename}"
+            # 保存上传的文件到独立的任务目录
+            content = await file.read()
+            job_dir, upload_path = storage.save_upload(content)
             
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(markdown_text)
+            # 在受限子进程中提取文本并转换为指定格式，单个文件超限不影响其余文件
+            result = await asyncio.to_thread(
+                convert_with_limits, upload_path, conversion_limits, file.filename, False,
+                format_list, Path(file.filename).stem, rule_packs
+            )
             
-            # 清理上传的PDF文件
-            os.remove(upload_path)
+            # 保存各格式结果（按内容寻址）
+            saved = save_conversion_outputs(result["outputs"], file.filename)
+            primary = saved[format_list[0]]
             
             results.append({
                 "filename": file.filename,
-                "output_filename": output_filename,
+                "output_filename": primary["filename"],
+                "download_name": primary["download_name"],
+                "download_url": primary["download_url"],
+                "outputs": saved,
                 "status": "success"
             })
             
+        except ConversionLimitExceeded as e:
+            failed_files.append({"filename": file.filename, "error": str(e), "limit": e.kind})
         except Exception as e:
             failed_files.append({"filename": file.filename, "error": str(e)})
-            # 清理可能存在的上传文件
-            upload_path = f"uploads/{file.filename}"
-            if os.path.exists(upload_path):
-                os.remove(upload_path)
+        finally:
+            # 清理上传的PDF文件
+            if job_dir is not None:
+                storage.remove_job_dir(job_dir)
     
     return {
         "message": f"批量转换完成",
@@ -633,17 +654,152 @@ async def convert_pdfs_batch(files: list[UploadFile] = File(...)):
         "failed_files": failed_files
     }
 
+@app.post("/convert-pages")
+async def convert_pdf_pages(
+    file: UploadFile = File(None),
+    doc_id: str = Form(None),
+    pages: str = Form(None),
+    rules: str = Form(None),
+):
+    """
+    按页码范围转换PDF为Markdown
+    首次请求上传文件并返回 doc_id，后续请求只需提交 doc_id 和页码范围（如 "120-140"），
+    复用已打开的文档句柄和已提取的页面文本；rules 指定标题规则包，默认根据文本自动选择
+    """
+    try:
+        rule_packs = parse_rule_packs(rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if file is not None:
+        if not file.filename.endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="请上传PDF文件")
+        content = await file.read()
+        doc_id = compute_document_id(content)
+        cache_path = f"uploads/cache/{doc_id}.pdf"
+        if not os.path.exists(cache_path):
+            # 先确认文件能被解析且页数未超限，再放入缓存，无效文件不会占用缓存
+            job_dir, upload_path = storage.save_upload(content)
+            try:
+                page_count = await asyncio.to_thread(document_pool.probe, upload_path)
+                if conversion_limits.max_pages is not None and page_count > conversion_limits.max_pages:
+                    raise HTTPException(
+                        status_code=422,
+                        detail=f"转换超出资源限制: 页数 {page_count} 超过上限 {conversion_limits.max_pages}",
+                    )
+                os.replace(upload_path, cache_path)
+            except ConversionLimitExceeded as e:
+                raise HTTPException(status_code=422, detail=f"转换超出资源限制: {str(e)}")
+            except ConversionError as e:
+                raise HTTPException(status_code=400, detail=f"无法解析PDF文件: {str(e)}")
+            finally:
+                storage.remove_job_dir(job_dir)
+        else:
+            os.utime(cache_path)
+    elif doc_id:
+        if not re.fullmatch(r'[0-9a-f]{64}', doc_id):
+            raise HTTPException(status_code=400, detail="无效的文档ID")
+        cache_path = f"uploads/cache/{doc_id}.pdf"
+        try:
+            # 刷新修改时间，正在使用的文档不会因上传时间过早而被清理
+            os.utime(cache_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="文档不存在，请重新上传")
+    else:
+        raise HTTPException(status_code=400, detail="请上传PDF文件或提供文档ID")
+
+    try:
+        # 打开文档与提取文本可能较慢，放到线程中执行，避免阻塞事件循环
+        page_count = await asyncio.to_thread(document_pool.page_count, doc_id, cache_path)
+        if conversion_limits.max_pages is not None and page_count > conversion_limits.max_pages:
+            raise HTTPException(
+                status_code=422,
+                detail=f"转换超出资源限制: 页数 {page_count} 超过上限 {conversion_limits.max_pages}",
+            )
+        try:
+            page_list = parse_page_ranges(pages, page_count)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        text = await asyncio.to_thread(document_pool.extract_pages, doc_id, cache_path, page_list)
+        if rule_packs is None:
+            # 未指定时按文档自动检测一次，同一文档的各页码范围使用相同规则
+            rule_packs = await asyncio.to_thread(document_pool.rule_packs, doc_id, cache_path)
+        markdown_text = await asyncio.to_thread(
+            lambda: clean_markdown(detect_headings(text, rules=rule_packs))
+        )
+
+        return {
+            "message": "转换成功",
+            "doc_id": doc_id,
+            "page_count": page_count,
+            "pages": [page_num + 1 for page_num in page_list],
+            "markdown": markdown_text
+        }
+
+    except HTTPException:
+        raise
+    except ConversionLimitExceeded as e:
+        raise HTTPException(status_code=422, detail=f"转换超出资源限制: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"转换过程中出现错误: {str(e)}")
+
+@app.on_event("startup")
+def start_storage_sweeper():
+    """服务启动时开始后台清理过期文件"""
+    storage_sweeper.start()
+
+@app.on_event("shutdown")
+def close_document_pool():
+    """服务关闭时结束文档缓存进程并停止清理线程"""
+    document_pool.close()
+    storage_sweeper.stop()
+
+@app.get("/metrics")
+async def metrics():
+    """查看转换资源限制触发统计"""
+    return limit_metrics.snapshot()
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """查看文档缓存状态"""
+    return await asyncio.to_thread(document_pool.info)
+
+# 下载文件的媒体类型
+DOWNLOAD_MEDIA_TYPES = {
+    ".md": "text/markdown",
+    ".html": "text/html",
+    ".json": "application/json",
+    ".txt": "text/plain",
+}
+
 @app.get("/download/{filename}")
-async def download_file(filename: str):
-    """下载转换后的Markdown文件"""
-    file_path = f"outputs/{filename}"
-    if not os.path.exists(file_path):
+async def download_file(filename: str, name: str = None, source: str = None, converted: str = None):
+    """
+    下载转换结果，name 为下载时使用的文件名
+    Markdown文件提供 source（原文件名）时，在正文前添加文档头部，converted 为转换时间
+    """
+    file_path = storage.output_path(filename)
+    if file_path is None or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    return FileResponse(
-        path=file_path,
-        filename=filename,
-        media_type='text/markdown'
+    download_name = os.path.basename(name) if name else filename
+    extension = os.path.splitext(filename)[1]
+    media_type = DOWNLOAD_MEDIA_TYPES.get(extension, 'application/octet-stream')
+    if extension != ".md" or not source:
+        return FileResponse(path=file_path, filename=download_name, media_type=media_type)
+    
+    with open(file_path, 'r', encoding='utf-8') as f:
+        body = f.read()
+    quoted_name = quote(download_name)
+    if quoted_name != download_name:
+        content_disposition = f"attachment; filename*=utf-8''{quoted_name}"
+    else:
+        content_disposition = f'attachment; filename="{download_name}"'
+    return Response(
+        content=markdown_header(source, converted) + body,
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition},
     )
 
 if __name__ == "__main__":
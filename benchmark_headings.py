@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标题检测阶段基准测试
+对比逐行字符串列表实现与紧凑行表示（pdf_to_markdown.LineIndex）在大文本上的
+耗时与峰值内存（RSS）。每种实现在独立子进程中运行，互不影响峰值内存统计。
+参照实现固定为改用紧凑行表示之前的版本，其标题规则与当前规则包不同，两者输出不逐字相同。
+
+用法:
+    python benchmark_headings.py --lines 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def generate_text(path, line_count, seed=0):
+    """生成模拟PDF提取结果的文本：正文行、空行、页码标记与各类编号标题"""
+    rng = random.Random(seed)
+    body = [
+        "本研究基于大量实验数据，对模型的泛化能力进行了系统分析。",
+        "The results indicate a significant improvement over the baseline method.",
+        "表3列出了不同参数设置下的实验结果，其中加粗表示最优值。",
+        "where x denotes the input feature vector and y the corresponding label",
+    ]
+    headings = ["1. 绪论", "2.1 研究背景", "3.2.1 实验设置", "一、总则", "(1) 主要目标", "第三章 方法", "ABSTRACT"]
+
+    with open(path, "w", encoding="utf-8") as f:
+        page = 1
+        for i in range(line_count):
+            r = rng.random()
+            if i % 40 == 0:
+                f.write(f"<!-- 第{page}页 -->\n")
+                page += 1
+            elif r < 0.03:
+                f.write(rng.choice(headings) + "\n")
+            elif r < 0.10:
+                f.write("\n")
+            else:
+                f.write(rng.choice(body) + "\n")
+
+
+def detect_headings_list(text):
+    """
+    固定的参照实现（改用紧凑行表示之前的 detect_headings，保持原样不随规则包更新）：
+    按行拆分为字符串列表，逐行用正则判断，再构造带前缀的新列表
+    """
+    lines = text.split('\n')
+    processed_lines = []
+    
+    for line in lines:
+        if not line.strip():
+            processed_lines.append(line)
+            continue
+        
+        if re.match(r'^\d+(\.\d+)*\.?\s+', line):
+            level = line.count('.') + 1
+            if level > 6:
+                level = 6
+            processed_lines.append('#' * level + ' ' + line)
+        elif re.match(r'^[一二三四五六七八九十]+、', line):
+            processed_lines.append('# ' + line)
+        elif re.match(r'^\([一二三四五六七八九十\d]+\)', line):
+            processed_lines.append('## ' + line)
+        elif len(line) < 50 and (line.isupper() or '第' in line and '章' in line):
+            processed_lines.append('# ' + line)
+        else:
+            processed_lines.append(line)
+    
+    return '\n'.join(processed_lines)
+
+
+def max_rss_bytes():
+    """当前进程的峰值RSS（字节）"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为KB，macOS 上为字节
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_single(impl, path):
+    """子进程中运行一种实现，输出JSON结果"""
+    from pdf_to_markdown import detect_headings
+
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    baseline = max_rss_bytes()
+
+    func = detect_headings if impl == "compact" else detect_headings_list
+    start = time.perf_counter()
+    result = func(text)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "impl": impl,
+        "seconds": elapsed,
+        "peak_rss_increase": max_rss_bytes() - baseline,
+        "output_chars": len(result),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标题检测阶段基准测试")
+    parser.add_argument("--lines", type=int, default=1000000, help="模拟文本行数")
+    parser.add_argument("--run", choices=["list", "compact"], help=argparse.SUPPRESS)
+    parser.add_argument("--input", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_single(args.run, args.input)
+        return
+
+    fd, path = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        generate_text(path, args.lines)
+        print(f"文本行数: {args.lines}，文件大小: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        results = {}
+        for impl in ("list", "compact"):
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), "--run", impl, "--input", path]
+            )
+            results[impl] = json.loads(output)
+
+        print(f"{'实现':<10}{'耗时(秒)':>12}{'峰值RSS增量(MB)':>20}")
+        for impl, item in results.items():
+            print(f"{impl:<10}{item['seconds']:>12.3f}{item['peak_rss_increase'] / 1024 / 1024:>20.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+带资源限制的PDF转换
+每次转换在独立的子进程中执行，并施加以下限制：
+- 墙钟超时：超时后强制结束子进程
+- 最大页数：超过页数的文档直接判定失败
+- 内存上限：通过 rlimit 限制子进程地址空间（Windows 上不可用时跳过）
+- CPU时间上限：通过 rlimit 限制子进程CPU时间
+触发限制的任务会被记录到 limit_metrics 中，便于定位拖慢吞吐的输入文件。
+"""
+
+import multiprocessing
+import re
+import signal
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 转换子进程不从服务进程直接 fork：服务进程中有线程池、清理线程和采样线程，
+# fork 时若其他线程持有锁，子进程可能死锁。优先使用 forkserver，不支持时使用 spawn。
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context("forkserver")
+    # 由 forkserver 预先导入转换用到的模块，子进程无需各自重新导入
+    _mp_context.set_forkserver_preload(["pdf_to_markdown", "document_tree", "doc_cache"])
+else:
+    _mp_context = multiprocessing.get_context("spawn")
+
+
+# 子进程关闭管道后等待其退出的时间（秒），用于读取退出码
+EXIT_WAIT_SECONDS = 5
+
+# MuPDF 内存分配失败的错误信息，如 "code=2: malloc (40 bytes) failed"
+MUPDF_MALLOC_FAILURE = re.compile(r'\b(?:malloc|calloc|realloc)\b.*\bfailed\b|out of memory', re.IGNORECASE)
+
+
+class ConversionLimits:
+    """单次转换的资源限制配置，取值为 None 表示不限制"""
+
+    def __init__(self, timeout_seconds=120, max_pages=2000,
+                 max_memory_bytes=2 * 1024 * 1024 * 1024, max_cpu_seconds=None):
+        self.timeout_seconds = timeout_seconds
+        self.max_pages = max_pages
+        self.max_memory_bytes = max_memory_bytes
+        self.max_cpu_seconds = max_cpu_seconds
+
+
+class ConversionError(Exception):
+    """转换失败（非资源限制原因）"""
+
+
+class NoTextError(ConversionError):
+    """PDF中未能提取到文本"""
+
+
+class InvalidPDFError(ConversionError):
+    """PDF文件无法打开或解析"""
+
+
+class ConversionLimitExceeded(ConversionError):
+    """转换触发资源限制"""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class LimitMetrics:
+    """资源限制触发次数统计"""
+
+    KINDS = ("timeout", "max_pages", "memory", "cpu", "crashed")
+
+    def __init__(self, history_size=100):
+        self._lock = threading.Lock()
+        self.counts = {kind: 0 for kind in self.KINDS}
+        self.completed = 0
+        self.recent = deque(maxlen=history_size)
+
+    def record_success(self):
+        with self._lock:
+            self.completed += 1
+
+    def record_limit(self, kind, label, elapsed):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.recent.append({
+                "filename": label,
+                "limit": kind,
+                "elapsed_seconds": round(elapsed, 3),
+                "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+            })
+
+    def snapshot(self):
+        """返回当前统计数据"""
+        with self._lock:
+            return {
+                "completed": self.completed,
+                "limit_hits": dict(self.counts),
+                "recent_limit_hits": list(self.recent),
+            }
+
+
+limit_metrics = LimitMetrics()
+
+
+def _apply_rlimits(limits):
+    """在子进程中设置 rlimit"""
+    if resource is None:
+        return
+    if limits.max_memory_bytes is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limits.max_memory_bytes, limits.max_memory_bytes))
+    if limits.max_cpu_seconds is not None:
+        cpu = int(limits.max_cpu_seconds)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+
+
+def _conversion_worker(conn, pdf_path, limits, profile=False, formats=None, title=None, rules=None):
+    """子进程入口：检查页数、提取文本并转换为指定格式，结果通过管道返回"""
+    profiler = None
+    try:
+        _apply_rlimits(limits)
+
+        import fitz  # pymupdf
+        from pdf_to_markdown import extract_text_with_pymupdf
+        from document_tree import render_document
+
+        # 先单独打开一次：文件损坏或不是PDF时单独报告，重试也不会成功
+        try:
+            doc = fitz.open(pdf_path)
+        except fitz.FileDataError as e:
+            conn.send(("invalid", f"无法打开PDF文件: {e}"))
+            return
+        page_count = len(doc)
+        doc.close()
+        if limits.max_pages is not None and page_count > limits.max_pages:
+            conn.send(("limit", "max_pages", f"页数超过上限: {page_count} > {limits.max_pages}"))
+            return
+
+        if profile:
+            from profiling import ConversionProfiler
+            profiler = ConversionProfiler()
+            profiler.start()
+
+        text = extract_text_with_pymupdf(pdf_path, profiler)
+        if not text.strip():
+            conn.send(("empty", "PDF文件无法提取文本内容"))
+            return
+
+        # 多种格式共用一次标题检测，Markdown 结果与请求的其他格式无关
+        outputs = render_document(text, formats or ["markdown"], title, rules, profiler)
+
+        report = None
+        if profiler is not None:
+            profiler.stop()
+            report = profiler.report()
+        conn.send(("ok", outputs, report))
+
+    except MemoryError:
+        conn.send(("limit", "memory", "内存占用超过上限"))
+    except Exception as e:
+        if MUPDF_MALLOC_FAILURE.search(str(e)):
+            # rlimit 下 MuPDF 的内存分配失败以 RuntimeError 形式抛出，而不是 MemoryError
+            conn.send(("limit", "memory", f"内存占用超过上限: {e}"))
+        else:
+            conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+def convert_with_limits(pdf_path, limits=None, label=None, profile=False, formats=None, title=None,
+                        rules=None):
+    """
+    在受限子进程中转换PDF（Markdown结果不含文档头部）
+
+    参数:
+        pdf_path: PDF文件路径
+        limits: ConversionLimits，默认使用 ConversionLimits()
+        label: 用于统计记录的文件名，默认为 pdf_path
+        profile: 是否在子进程中开启性能分析
+        formats: 输出格式列表（见 document_tree.RENDERERS），默认只输出 markdown
+        title: 文档标题，用于 HTML / JSON 输出
+        rules: 标题规则包名称元组（见 heading_rules.RULE_PACKS），默认根据文本自动选择
+    返回:
+        {"outputs": {格式名: 内容}, "profile": 分析结果或None}
+    异常:
+        ConversionLimitExceeded: 触发超时、页数、内存或CPU限制
+        NoTextError: 未能提取到文本
+        InvalidPDFError: 文件无法作为PDF打开
+        ConversionError: 其他转换失败
+    """
+    if limits is None:
+        limits = ConversionLimits()
+    if label is None:
+        label = pdf_path
+
+    parent_conn, child_conn = _mp_context.Pipe(duplex=False)
+    process = _mp_context.Process(
+        target=_conversion_worker,
+        args=(child_conn, pdf_path, limits, profile, formats, title, rules),
+        daemon=True,
+    )
+    start = time.monotonic()
+    process.start()
+    child_conn.close()
+
+    try:
+        if not parent_conn.poll(limits.timeout_seconds):
+            process.kill()
+            process.join()
+            limit_metrics.record_limit("timeout", label, time.monotonic() - start)
+            raise ConversionLimitExceeded(
+                "timeout", f"转换超时（超过{limits.timeout_seconds}秒）")
+
+        try:
+            result = parent_conn.recv()
+        except EOFError:
+            # 子进程未返回结果就关闭了管道（被 SIGXCPU / SIGKILL 结束或崩溃），按退出码分类
+            process.join(EXIT_WAIT_SECONDS)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            elapsed = time.monotonic() - start
+            kind = _classify_exit(process.exitcode)
+            limit_metrics.record_limit(kind, label, elapsed)
+            raise ConversionLimitExceeded(kind, f"转换进程异常退出（退出码 {process.exitcode}）")
+        elapsed = time.monotonic() - start
+
+        process.join()
+        status = result[0]
+        if status == "ok":
+            limit_metrics.record_success()
+            return {"outputs": result[1], "profile": result[2]}
+        if status == "limit":
+            limit_metrics.record_limit(result[1], label, elapsed)
+            raise ConversionLimitExceeded(result[1], result[2])
+        if status == "empty":
+            raise NoTextError(result[1])
+        if status == "invalid":
+            raise InvalidPDFError(result[1])
+        raise ConversionError(result[1])
+
+    finally:
+        parent_conn.close()
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def _classify_exit(exitcode):
+    """根据子进程退出码判断触发的限制类型"""
+    sigxcpu = getattr(signal, "SIGXCPU", None)
+    if sigxcpu is not None and exitcode == -sigxcpu:
+        return "cpu"
+    if exitcode == -signal.SIGKILL:
+        # Linux OOM killer 或外部强制结束
+        return "memory"
+    return "crashed"
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF文档句柄与页面文本缓存
+为按页码范围的重复转换请求（如文档查看器滚动）提供有界LRU缓存：
+- 已打开的fitz文档句柄池，避免重复解析xref表
+- 按页缓存提取后的文本，按内存占用淘汰
+- 按文档缓存自动检测的标题规则包，同一文档的不同页码范围使用相同规则
+DocumentPoolProcess 将缓存放在独立子进程中，受内存上限和单次调用超时约束。
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import fitz  # pymupdf
+
+from conversion_limits import (
+    EXIT_WAIT_SECONDS, MUPDF_MALLOC_FAILURE, ConversionError, ConversionLimitExceeded, ConversionLimits,
+    _apply_rlimits, _classify_exit, _mp_context, limit_metrics
+)
+from heading_rules import detect_rule_packs
+
+
+def compute_document_id(content):
+    """根据PDF内容计算文档ID（sha256），相同内容得到相同ID"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def parse_page_ranges(spec, page_count):
+    """
+    解析页码范围字符串，返回从0开始的页码列表
+
+    参数:
+        spec: 页码范围，如 "120-140" "1,3,5-7"，页码从1开始；为空表示全部页面
+        page_count: 文档总页数
+    返回:
+        按出现顺序排列、去重后的页码列表（从0开始）
+    """
+    if spec is None or not spec.strip():
+        return list(range(page_count))
+
+    pages = []
+    seen = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start_str, end_str = part.split('-', 1)
+                start = int(start_str) if start_str.strip() else 1
+                end = int(end_str) if end_str.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"无效的页码范围: {part}") from None
+
+        if start < 1 or end < start:
+            raise ValueError(f"无效的页码范围: {part}")
+        if start > page_count:
+            raise ValueError(f"页码超出范围: {part}（共{page_count}页）")
+        end = min(end, page_count)
+
+        for page_num in range(start - 1, end):
+            if page_num not in seen:
+                seen.add(page_num)
+                pages.append(page_num)
+
+    if not pages:
+        raise ValueError("未指定任何页码")
+    return pages
+
+
+class DocumentPool:
+    """
+    fitz文档句柄与页面文本的LRU缓存
+
+    - 文档句柄按打开文件大小估算内存占用，超过 max_documents 或
+      max_document_bytes 时淘汰最久未使用的句柄并关闭
+    - 页面文本按字符串实际占用计算，超过 max_text_bytes 时淘汰最久未使用的页面
+    - 自动检测的标题规则包按文档缓存，最多保留 max_rule_entries 个文档
+    """
+
+    # 自动检测标题规则包时采样的字符数与最大页数
+    RULE_SAMPLE_CHARS = 20000
+    RULE_SAMPLE_PAGES = 20
+
+    def __init__(self, max_documents=16, max_document_bytes=512 * 1024 * 1024,
+                 max_text_bytes=128 * 1024 * 1024, max_rule_entries=4096):
+        self.max_documents = max_documents
+        self.max_document_bytes = max_document_bytes
+        self.max_text_bytes = max_text_bytes
+        self.max_rule_entries = max_rule_entries
+
+        self._lock = threading.RLock()
+        self._documents = OrderedDict()  # doc_id -> (path, doc, size)
+        self._document_bytes = 0
+        self._pages = OrderedDict()  # (doc_id, page_num) -> (text, size)
+        self._text_bytes = 0
+        self._rule_packs = OrderedDict()  # doc_id -> 规则包名称元组
+
+        self.stats = {
+            "document_hits": 0,
+            "document_misses": 0,
+            "document_evictions": 0,
+            "page_hits": 0,
+            "page_misses": 0,
+            "page_evictions": 0,
+        }
+
+    def _get_document(self, doc_id, path):
+        """获取已打开的文档句柄，未命中时打开并放入缓存（调用方需持有锁）"""
+        entry = self._documents.get(doc_id)
+        if entry is not None:
+            self._documents.move_to_end(doc_id)
+            self.stats["document_hits"] += 1
+            return entry[1]
+
+        self.stats["document_misses"] += 1
+        doc = fitz.open(path)
+        size = os.path.getsize(path)
+        self._documents[doc_id] = (path, doc, size)
+        self._document_bytes += size
+        self._evict_documents(keep=doc_id)
+        return doc
+
+    def _evict_documents(self, keep=None):
+        """按数量和内存上限淘汰文档句柄（保留刚打开的 keep）"""
+        while self._documents and (
+            len(self._documents) > self.max_documents
+            or self._document_bytes > self.max_document_bytes
+        ):
+            oldest_id = next(iter(self._documents))
+            if oldest_id == keep:
+                break
+            _, doc, size = self._documents.pop(oldest_id)
+            self._document_bytes -= size
+            doc.close()
+            self.stats["document_evictions"] += 1
+
+    def _evict_pages(self):
+        """按内存上限淘汰页面文本"""
+        while self._pages and self._text_bytes > self.max_text_bytes:
+            _, (_, size) = self._pages.popitem(last=False)
+            self._text_bytes -= size
+            self.stats["page_evictions"] += 1
+
+    def probe(self, path):
+        """打开文档检查能否解析并返回页数，不放入缓存"""
+        doc = fitz.open(path)
+        try:
+            return len(doc)
+        finally:
+            doc.close()
+
+    def page_count(self, doc_id, path):
+        """返回文档总页数"""
+        with self._lock:
+            return len(self._get_document(doc_id, path))
+
+    def get_page_text(self, doc_id, path, page_num):
+        """获取单页文本，优先使用缓存"""
+        key = (doc_id, page_num)
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None:
+                self._pages.move_to_end(key)
+                self.stats["page_hits"] += 1
+                return entry[0]
+
+            self.stats["page_misses"] += 1
+            doc = self._get_document(doc_id, path)
+            text = doc.load_page(page_num).get_text()
+            size = sys.getsizeof(text)
+            self._pages[key] = (text, size)
+            self._text_bytes += size
+            self._evict_pages()
+            return text
+
+    def extract_pages(self, doc_id, path, pages):
+        """
+        按页码列表提取文本，格式与 extract_text_with_pymupdf 一致
+
+        参数:
+            doc_id: 文档ID
+            path: PDF文件路径（缓存未命中时用于打开文档）
+            pages: 从0开始的页码列表
+        返回:
+            带页码标记的文本
+        """
+        parts = []
+        for page_num in pages:
+            text = self.get_page_text(doc_id, path, page_num)
+            parts.append(f"\n<!-- 第{page_num + 1}页 -->\n")
+            parts.append(text + "\n")
+        return "".join(parts)
+
+    def rule_packs(self, doc_id, path):
+        """
+        返回文档的标题规则包，每个文档只检测一次
+
+        从文档开头的页面取样（与页码范围无关），使同一文档的不同页码范围
+        得到相同的规则包和标题层级
+        """
+        with self._lock:
+            packs = self._rule_packs.get(doc_id)
+            if packs is not None:
+                self._rule_packs.move_to_end(doc_id)
+                return packs
+
+            page_count = len(self._get_document(doc_id, path))
+            parts = []
+            sampled = 0
+            for page_num in range(min(page_count, self.RULE_SAMPLE_PAGES)):
+                text = self.get_page_text(doc_id, path, page_num)
+                parts.append(text)
+                sampled += len(text)
+                if sampled >= self.RULE_SAMPLE_CHARS:
+                    break
+            packs = detect_rule_packs("\n".join(parts), self.RULE_SAMPLE_CHARS)
+
+            self._rule_packs[doc_id] = packs
+            while len(self._rule_packs) > self.max_rule_entries:
+                self._rule_packs.popitem(last=False)
+            return packs
+
+    def invalidate(self, doc_id):
+        """移除某个文档的句柄、全部页面缓存和规则包"""
+        with self._lock:
+            self._rule_packs.pop(doc_id, None)
+            entry = self._documents.pop(doc_id, None)
+            if entry is not None:
+                _, doc, size = entry
+                self._document_bytes -= size
+                doc.close()
+            for key in [k for k in self._pages if k[0] == doc_id]:
+                _, size = self._pages.pop(key)
+                self._text_bytes -= size
+
+    def close(self):
+        """关闭所有文档句柄并清空缓存"""
+        with self._lock:
+            for _, doc, _ in self._documents.values():
+                doc.close()
+            self._documents.clear()
+            self._pages.clear()
+            self._rule_packs.clear()
+            self._document_bytes = 0
+            self._text_bytes = 0
+
+    def info(self):
+        """返回缓存状态"""
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "document_bytes": self._document_bytes,
+                "pages": len(self._pages),
+                "text_bytes": self._text_bytes,
+                **self.stats,
+            }
+
+
+def _pool_worker(conn, max_memory_bytes, pool_options):
+    """DocumentPoolProcess 子进程入口：逐条执行父进程发来的 DocumentPool 方法调用"""
+    # 子进程长期运行，CPU时间上限会累计，只限制内存；单次调用的耗时由父进程的超时约束
+    _apply_rlimits(ConversionLimits(max_memory_bytes=max_memory_bytes, max_cpu_seconds=None))
+    pool = DocumentPool(**pool_options)
+    try:
+        while True:
+            try:
+                method, args = conn.recv()
+            except EOFError:
+                break
+            try:
+                conn.send(("ok", getattr(pool, method)(*args)))
+            except MemoryError:
+                pool.close()
+                conn.send(("limit", "内存占用超过上限"))
+            except Exception as e:
+                if MUPDF_MALLOC_FAILURE.search(str(e)):
+                    pool.close()
+                    conn.send(("limit", f"内存占用超过上限: {e}"))
+                else:
+                    conn.send(("error", str(e)))
+    finally:
+        pool.close()
+        conn.close()
+
+
+class DocumentPoolProcess:
+    """
+    在独立子进程中运行的 DocumentPool
+
+    fitz 打开文档和提取文本时通常不释放GIL，在服务进程中执行时，异常的PDF会阻塞所有请求。
+    这里所有调用都转发到子进程：子进程受 limits.max_memory_bytes 约束，单次调用超过
+    call_timeout 秒或子进程异常退出时结束子进程（缓存随之清空），下次调用时重新启动。
+    调用按顺序执行，一次异常调用最多阻塞其他请求 call_timeout 秒。
+    """
+
+    def __init__(self, limits=None, call_timeout=30, **pool_options):
+        self.limits = limits or ConversionLimits()
+        self.call_timeout = call_timeout
+        self.pool_options = pool_options
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        parent_conn, child_conn = _mp_context.Pipe()
+        process = _mp_context.Process(
+            target=_pool_worker,
+            args=(child_conn, self.limits.max_memory_bytes, self.pool_options),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self._process = process
+        self._conn = parent_conn
+
+    def _stop(self):
+        """结束子进程（调用方需持有锁）"""
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            self._process.kill()
+        self._process.join()
+        self._conn.close()
+        self._process = None
+        self._conn = None
+
+    def _call(self, label, method, *args):
+        """
+        在子进程中调用 DocumentPool 方法
+
+        异常:
+            ConversionLimitExceeded: 调用超时、内存超限或子进程异常退出
+            ConversionError: 方法执行失败（如文档无法打开）
+        """
+        with self._lock:
+            if self._process is not None and not self._process.is_alive():
+                self._stop()
+            if self._process is None:
+                self._start()
+
+            start = time.monotonic()
+            self._conn.send((method, args))
+            if not self._conn.poll(self.call_timeout):
+                self._stop()
+                self.restarts += 1
+                limit_metrics.record_limit("timeout", label, time.monotonic() - start)
+                raise ConversionLimitExceeded("timeout", f"处理超时（超过{self.call_timeout}秒）")
+
+            try:
+                status, value = self._conn.recv()
+            except EOFError:
+                process = self._process
+                process.join(EXIT_WAIT_SECONDS)
+                self._stop()
+                exitcode = process.exitcode
+                self.restarts += 1
+                kind = _classify_exit(exitcode)
+                limit_metrics.record_limit(kind, label, time.monotonic() - start)
+                raise ConversionLimitExceeded(kind, f"文档缓存进程异常退出（退出码 {exitcode}）")
+
+        if status == "ok":
+            return value
+        if status == "limit":
+            limit_metrics.record_limit("memory", label, time.monotonic() - start)
+            raise ConversionLimitExceeded("memory", value)
+        raise ConversionError(value)
+
+    def probe(self, path):
+        """检查文档能否打开并返回页数，不放入缓存"""
+        return self._call(path, "probe", path)
+
+    def page_count(self, doc_id, path):
+        return self._call(doc_id, "page_count", doc_id, path)
+
+    def extract_pages(self, doc_id, path, pages):
+        return self._call(doc_id, "extract_pages", doc_id, path, pages)
+
+    def rule_packs(self, doc_id, path):
+        return self._call(doc_id, "rule_packs", doc_id, path)
+
+    def invalidate(self, doc_id):
+        return self._call(doc_id, "invalidate", doc_id)
+
+    def info(self):
+        """返回子进程中的缓存状态及子进程重启次数"""
+        return {**self._call("info", "info"), "restarts": self.restarts}
+
+    def close(self):
+        """结束子进程，释放所有文档句柄"""
+        with self._lock:
+            self._stop()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文档中间结构与多格式输出
+提取的文本只做一次标题检测（LineIndex）：Markdown 直接由 LineIndex 输出，
+与只请求 Markdown 时的结果逐字相同；HTML / JSON / 纯文本由同一 LineIndex 构建的
+轻量文档树（标题、段落、页码标记）序列化，额外的格式只增加序列化开销。
+
+文档树为节点字典列表：
+    {"type": "page", "number": 3}
+    {"type": "heading", "level": 2, "text": "1.1 研究背景"}
+    {"type": "paragraph", "lines": ["第一行", "第二行"]}
+"""
+
+import html
+import json
+import re
+import time
+
+from pdf_to_markdown import LineIndex, clean_markdown
+
+PAGE_MARKER_PATTERN = re.compile(r'^<!-- 第(\d+)页 -->$')
+
+
+def build_document(text, rules=None, index=None):
+    """
+    将提取的文本解析为文档树
+
+    参数:
+        text: extract_text_with_pymupdf 返回的带页码标记的文本
+        rules: 标题规则包（见 heading_rules.resolve_matcher），默认根据文本自动选择
+        index: 已构建的 LineIndex，提供时不再重新检测标题
+    返回:
+        节点列表
+    """
+    nodes = []
+    paragraph = []
+
+    def flush_paragraph():
+        if paragraph:
+            nodes.append({"type": "paragraph", "lines": paragraph[:]})
+            paragraph.clear()
+
+    if index is None:
+        index = LineIndex(text, rules)
+    levels = index.levels
+    for i in range(len(index)):
+        line = index.line(i)
+        if not line.strip():
+            flush_paragraph()
+            continue
+
+        marker = PAGE_MARKER_PATTERN.match(line)
+        if marker:
+            flush_paragraph()
+            nodes.append({"type": "page", "number": int(marker.group(1))})
+            continue
+
+        level = levels[i]
+        if level:
+            flush_paragraph()
+            nodes.append({"type": "heading", "level": level, "text": line.strip()})
+        else:
+            paragraph.append(line.strip())
+
+    flush_paragraph()
+    return nodes
+
+
+def render_html(nodes, title=None):
+    """渲染为HTML页面，页码标记渲染为带 data-page 属性的锚点"""
+    parts = [
+        "<!DOCTYPE html>",
+        "<html>",
+        "<head>",
+        '<meta charset="UTF-8">',
+        f"<title>{html.escape(title or '')}</title>",
+        "</head>",
+        "<body>",
+    ]
+    for node in nodes:
+        if node["type"] == "page":
+            parts.append(f'<a id="page-{node["number"]}" class="page-marker" data-page="{node["number"]}"></a>')
+        elif node["type"] == "heading":
+            level = node["level"]
+            parts.append(f"<h{level}>{html.escape(node['text'])}</h{level}>")
+        else:
+            parts.append("<p>" + "<br>\n".join(html.escape(line) for line in node["lines"]) + "</p>")
+    parts.extend(["</body>", "</html>", ""])
+    return '\n'.join(parts)
+
+
+def render_json(nodes, title=None):
+    """渲染为JSON文档树"""
+    return json.dumps({"title": title, "nodes": nodes}, ensure_ascii=False)
+
+
+def render_text(nodes, title=None):
+    """渲染为纯文本，去掉标题标记和页码标记"""
+    blocks = []
+    for node in nodes:
+        if node["type"] == "heading":
+            blocks.append(node["text"])
+        elif node["type"] == "paragraph":
+            blocks.append('\n'.join(node["lines"]))
+    return '\n\n'.join(blocks) + '\n'
+
+
+# 格式名 -> (渲染函数, 文件扩展名)；markdown 不经过文档树，由 render_document 直接从 LineIndex 输出
+RENDERERS = {
+    "markdown": (None, ".md"),
+    "html": (render_html, ".html"),
+    "json": (render_json, ".json"),
+    "text": (render_text, ".txt"),
+}
+
+
+def parse_formats(spec):
+    """
+    解析输出格式列表，如 "markdown,html,json"
+
+    返回:
+        去重后的格式名列表；为空时返回 ["markdown"]
+    异常:
+        ValueError: 包含不支持的格式
+    """
+    if spec is None or not spec.strip():
+        return ["markdown"]
+    formats = []
+    for name in spec.split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name == "md":
+            name = "markdown"
+        elif name == "txt":
+            name = "text"
+        if name not in RENDERERS:
+            raise ValueError(f"不支持的输出格式: {name}（可选: {', '.join(RENDERERS)}）")
+        if name not in formats:
+            formats.append(name)
+    return formats or ["markdown"]
+
+
+def render_document(text, formats, title=None, rules=None, profiler=None):
+    """
+    将提取的文本转换为多种格式，标题检测只进行一次
+
+    参数:
+        text: extract_text_with_pymupdf 返回的带页码标记的文本
+        formats: 格式名列表
+        title: 文档标题，用于 HTML / JSON 输出
+        rules: 标题规则包（见 heading_rules.resolve_matcher），默认根据文本自动选择
+        profiler: 不为空时记录标题检测的行数与耗时
+    返回:
+        {格式名: 渲染结果}
+    """
+    if profiler is not None:
+        start = time.perf_counter()
+
+    index = LineIndex(text, rules)
+
+    if profiler is not None:
+        profiler.record_headings(len(index), len(index.headings), time.perf_counter() - start)
+
+    outputs = {}
+    nodes = None
+    for name in formats:
+        if name == "markdown":
+            # 与 clean_markdown(detect_headings(text)) 相同
+            outputs[name] = clean_markdown(index.render())
+        else:
+            if nodes is None:
+                nodes = build_document(text, index=index)
+            outputs[name] = RENDERERS[name][0](nodes, title)
+    return outputs
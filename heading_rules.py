@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标题识别规则包
+按语言与文体组织的声明式标题规则（zh / en / legal / academic），启动时编译为匹配器，
+可按请求指定，也可根据文本样本自动选择。
+
+每条规则为一个字典：
+    name:       规则名称
+    starts:     行首可能出现的字符；为 None 时该规则对所有行生效（应尽量少用）
+    pattern:    从行首开始匹配的正则表达式
+    prefix / suffix / tail:
+                代替 pattern 的前缀形式：行首匹配 prefix，其后紧跟的一个字符属于 suffix，
+                再从该字符之后匹配可选的 tail（如 第X章 / 第X节 / 第X条 共用前缀 第[数字]+）
+    level:      标题层级（1-6），或 "depth" 表示按编号中的数字段数计算（如 2.1.3 为3级）
+    max_length: 可选，行长度上限
+    upper:      可选，为 True 时要求整行 isupper()
+
+编译后的匹配器按行首字符分桶，每行先查一次字典确定所在的桶。桶内前缀相同的规则只匹配一次前缀，
+再按其后的字符查表，判断开销不随这类规则的数量增长；普通 pattern 规则在桶内仍按顺序尝试，
+行首字符相同的规则较多时应改写为共用前缀的形式。
+"""
+
+import re
+import threading
+
+CN_NUMERALS = '一二三四五六七八九十百千零〇两'
+DIGITS = '0123456789'
+ROMAN = 'IVXLC'
+
+# 中文序号：第X章 / 第X节 等
+_CN_ORDINAL = rf'第[{CN_NUMERALS}\d]+'
+
+# 括号编号的左括号
+_OPEN_BRACKET = r'[(（]'
+
+# 数字编号：1 / 1. / 2.1 / 3.2.1
+_NUMBERED = {
+    "name": "数字编号", "starts": DIGITS, "pattern": r'\d+(?:\.\d+)*\.?\s+',
+    "level": "depth", "max_length": 60,
+}
+
+# 全大写短行（如 ABSTRACT），不限行首字符；要求不含中文且至少有两个连续的大写字母，
+# 避免 "图1 DNA序列" 这类图表标题和 "A B C" 这类短行被识别为标题
+_ALL_CAPS = {
+    "name": "全大写短行", "starts": None, "pattern": r'(?=.*[A-Z]{2})[^一-鿿]*$',
+    "level": 1, "max_length": 49, "upper": True,
+}
+
+RULE_PACKS = {
+    "zh": [
+        {"name": "章", "starts": "第", "prefix": _CN_ORDINAL, "suffix": "章", "level": 1, "max_length": 40},
+        {"name": "节", "starts": "第", "prefix": _CN_ORDINAL, "suffix": "节", "level": 2, "max_length": 40},
+        {"name": "中文编号", "starts": CN_NUMERALS, "pattern": rf'[{CN_NUMERALS}]+、', "level": 1},
+        {"name": "中文括号编号", "starts": "(（", "prefix": _OPEN_BRACKET, "suffix": CN_NUMERALS,
+         "tail": rf'[{CN_NUMERALS}]*[)）]', "level": 2},
+        {"name": "数字括号编号", "starts": "(（", "prefix": _OPEN_BRACKET, "suffix": DIGITS,
+         "tail": r'\d*[)）]', "level": 3},
+        _NUMBERED,
+    ],
+    "en": [
+        {"name": "Chapter", "starts": "Cc", "pattern": rf'(?:Chapter|CHAPTER)\s+(?:\d+|[{ROMAN}]+)\b',
+         "level": 1, "max_length": 60},
+        {"name": "Part", "starts": "P", "pattern": rf'(?:Part|PART)\s+(?:\d+|[{ROMAN}]+)\b',
+         "level": 1, "max_length": 60},
+        {"name": "Appendix", "starts": "A", "pattern": r'(?:Appendix|APPENDIX)\s+[A-Z\d]+\b',
+         "level": 1, "max_length": 60},
+        {"name": "Section", "starts": "S", "pattern": r'(?:Section|SECTION)\s+\d+(?:\.\d+)*\b',
+         "level": 2, "max_length": 60},
+        {"name": "罗马数字编号", "starts": ROMAN, "pattern": rf'[{ROMAN}]+\.\s+', "level": 1, "max_length": 60},
+        {"name": "括号编号", "starts": "(", "prefix": _OPEN_BRACKET, "suffix": DIGITS,
+         "tail": r'\d*[)）]', "level": 3},
+        _NUMBERED,
+        _ALL_CAPS,
+    ],
+    "legal": [
+        {"name": "编", "starts": "第", "prefix": _CN_ORDINAL, "suffix": "编", "level": 1, "max_length": 40},
+        {"name": "章", "starts": "第", "prefix": _CN_ORDINAL, "suffix": "章", "level": 1, "max_length": 40},
+        {"name": "节", "starts": "第", "prefix": _CN_ORDINAL, "suffix": "节", "level": 2, "max_length": 40},
+        {"name": "条", "starts": "第", "prefix": _CN_ORDINAL, "suffix": "条", "tail": r'\s|$', "level": 3},
+        {"name": "Article", "starts": "A", "pattern": r'(?:Article|ARTICLE)\s+\d+\b', "level": 2},
+        {"name": "§", "starts": "§", "pattern": r'§+\s*\d+', "level": 2},
+        {"name": "Section", "starts": "S", "pattern": r'(?:Section|SECTION)\s+\d+(?:\.\d+)*\b', "level": 3},
+    ],
+    "academic": [
+        {"name": "英文章节名", "starts": "AaIiRrBbMmEeDdCc",
+         "pattern": r'(?i:abstract|introduction|related work|background|materials and methods|methods?'
+                    r'|methodology|experiments?|results(?: and discussion)?|discussion|conclusions?'
+                    r'|references|bibliography|acknowledge?ments?|appendix)\s*$',
+         "level": 1},
+        {"name": "中文章节名", "starts": "摘引绪结参致附",
+         "pattern": r'(?:摘\s*要|引\s*言|绪\s*论|结\s*论|参考文献|致\s*谢|附\s*录)\s*$', "level": 1},
+        _NUMBERED,
+    ],
+}
+
+# 自动检测时用于判断文体的特征
+_LEGAL_MARKERS = re.compile(rf'^(?:{_CN_ORDINAL}条|Article\s+\d+|ARTICLE\s+\d+|§)', re.MULTILINE)
+_ACADEMIC_MARKERS = re.compile(
+    r'^\s*(?:摘\s*要|参考文献|Abstract|ABSTRACT|References|REFERENCES)\s*$', re.MULTILINE
+)
+_CJK_CHARS = re.compile(r'[一-鿿]')
+_LATIN_CHARS = re.compile(r'[A-Za-z]')
+
+
+class HeadingMatcher:
+    """由一组规则编译而成的标题匹配器"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        bucket_rules = {}
+        fallback = []
+
+        for rule in rules:
+            if rule.get("starts") is None:
+                fallback.append(rule)
+                continue
+            for char in rule["starts"]:
+                bucket_rules.setdefault(char, []).append(rule)
+
+        # 规则组合相同的字符共用同一组已编译的匹配步骤
+        compiled = {}
+        self._buckets = {}
+        for char, bucket in bucket_rules.items():
+            key = tuple(map(id, bucket))
+            if key not in compiled:
+                compiled[key] = self._compile_bucket(bucket)
+            self._buckets[char] = compiled[key]
+
+        # 兜底规则逐条检查：(长度上限, 是否要求全大写, 正则, 层级)
+        self._fallback = [
+            (
+                rule.get("max_length") if rule.get("max_length") is not None else float('inf'),
+                bool(rule.get("upper")),
+                re.compile(rule["pattern"]) if rule.get("pattern") else None,
+                rule["level"],
+            )
+            for rule in fallback
+        ]
+
+        # 供逐行扫描时快速跳过：行首字符不在 first_chars 中的行只可能命中兜底规则，
+        # 长度超过 fallback_max_length 或（fallback_upper_only 时）不是全大写的行不可能是标题
+        self.first_chars = frozenset(self._buckets)
+        self.fallback_upper_only = all(rule.get("upper") for rule in fallback)
+        if not fallback:
+            self.fallback_max_length = -1
+        elif any(rule.get("max_length") is None for rule in fallback):
+            self.fallback_max_length = float('inf')
+        else:
+            self.fallback_max_length = max(rule["max_length"] for rule in fallback)
+
+    @classmethod
+    def _compile_bucket(cls, bucket):
+        """
+        将一个桶内的规则编译为按顺序尝试的匹配步骤 (是否按前缀分派, 正则, 查找表)：
+        - 前缀相同的规则合并为一步，正则 "前缀(.)" 匹配一次后按捕获的下一个字符查表；
+          该步位于其中第一条规则的位置
+        - 相邻的普通规则合并为一条具名分组的正则
+        """
+        steps = []
+        prefix_tables = {}
+        for rule in bucket:
+            if rule.get("prefix") is not None:
+                table = prefix_tables.get(rule["prefix"])
+                if table is None:
+                    table = prefix_tables[rule["prefix"]] = {}
+                    steps.append([True, re.compile(f"(?:{rule['prefix']})(.)"), table])
+                max_length = rule.get("max_length")
+                entry = (
+                    max_length if max_length is not None else float('inf'),
+                    re.compile(rule["tail"]) if rule.get("tail") else None,
+                    rule["level"],
+                )
+                for char in rule["suffix"]:
+                    table.setdefault(char, []).append(entry)
+            else:
+                if not steps or steps[-1][0]:
+                    steps.append([False, [], {}])
+                step = steps[-1]
+                name = f"r{len(step[2])}"
+                step[1].append(f"(?P<{name}>{cls._rule_pattern(rule)})")
+                step[2][name] = rule["level"]
+
+        return tuple(
+            (by_prefix, regex if by_prefix else re.compile('|'.join(regex)), table)
+            for by_prefix, regex, table in steps
+        )
+
+    @staticmethod
+    def _rule_pattern(rule):
+        """规则对应的正则片段，长度上限编译为前瞻断言"""
+        pattern = rule["pattern"]
+        if rule.get("max_length") is not None:
+            pattern = f"(?=.{{0,{rule['max_length']}}}$){pattern}"
+        return pattern
+
+    @staticmethod
+    def _resolve_level(level, matched):
+        if level == "depth":
+            return min(len(re.findall(r'\d+', matched)), 6)
+        return level
+
+    def level(self, line):
+        """判断一行文本的标题层级，返回1-6，非标题返回0"""
+        if not line:
+            return 0
+
+        steps = self._buckets.get(line[0])
+        if steps is not None:
+            for by_prefix, regex, table in steps:
+                match = regex.match(line)
+                if match is None:
+                    continue
+                if by_prefix:
+                    for max_length, tail, level in table.get(match.group(1), ()):
+                        if len(line) > max_length:
+                            continue
+                        if tail is None:
+                            return self._resolve_level(level, line[:match.end()])
+                        tail_match = tail.match(line, match.end())
+                        if tail_match:
+                            return self._resolve_level(level, line[:tail_match.end()])
+                else:
+                    name = match.lastgroup
+                    return self._resolve_level(table[name], match.group(name))
+
+        for max_length, upper, regex, level in self._fallback:
+            if len(line) > max_length or upper and not line.isupper():
+                continue
+            if regex is not None and not regex.match(line):
+                continue
+            return level
+
+        return 0
+
+
+def parse_rule_packs(spec):
+    """
+    解析规则包列表，如 "zh,legal"
+
+    返回:
+        规则包名称元组；spec 为空或 "auto" 时返回 None，表示自动检测
+    异常:
+        ValueError: 包含未知的规则包
+    """
+    if spec is None or not spec.strip() or spec.strip().lower() == "auto":
+        return None
+    packs = []
+    for name in spec.split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in RULE_PACKS:
+            raise ValueError(f"未知的标题规则包: {name}（可选: {', '.join(RULE_PACKS)}）")
+        if name not in packs:
+            packs.append(name)
+    return tuple(packs) or None
+
+
+def detect_rule_packs(text, sample_chars=20000):
+    """
+    根据文本样本选择规则包：按中文字符与拉丁字母的比例选择 zh 或 en，
+    出现法律条款或论文章节特征时前置 legal / academic
+    """
+    sample = text[:sample_chars]
+    packs = []
+    if len(_LEGAL_MARKERS.findall(sample)) >= 3:
+        packs.append("legal")
+    if _ACADEMIC_MARKERS.search(sample):
+        packs.append("academic")
+
+    cjk = len(_CJK_CHARS.findall(sample))
+    latin = len(_LATIN_CHARS.findall(sample))
+    packs.append("zh" if cjk * 3 >= latin else "en")
+    return tuple(packs)
+
+
+_matcher_cache = {}
+_matcher_lock = threading.Lock()
+
+
+def get_matcher(packs):
+    """返回规则包组合对应的匹配器，每种组合只编译一次"""
+    packs = tuple(packs)
+    matcher = _matcher_cache.get(packs)
+    if matcher is None:
+        with _matcher_lock:
+            matcher = _matcher_cache.get(packs)
+            if matcher is None:
+                rules = []
+                for name in packs:
+                    # 多个规则包共享的规则（如数字编号）只保留第一次出现
+                    rules.extend(rule for rule in RULE_PACKS[name] if rule not in rules)
+                matcher = HeadingMatcher(rules)
+                _matcher_cache[packs] = matcher
+    return matcher
+
+
+def resolve_matcher(rules, text):
+    """
+    根据请求参数确定匹配器
+
+    参数:
+        rules: HeadingMatcher、规则包名称序列、规则包字符串（如 "zh,legal"），或 None / "auto"
+        text: 用于自动检测的文本
+    """
+    if isinstance(rules, HeadingMatcher):
+        return rules
+    if isinstance(rules, str) or rules is None:
+        rules = parse_rule_packs(rules)
+    if not rules:
+        rules = detect_rule_packs(text)
+    return get_matcher(rules)
+
+
+# 启动时预编译各单独规则包及自动检测可能产生的组合
+for _packs in [(name,) for name in RULE_PACKS] + [
+    (extra, base) for extra in ("legal", "academic") for base in ("zh", "en")
+] + [("legal", "academic", base) for base in ("zh", "en")]:
+    get_matcher(_packs)
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDFMark Web服务压力测试
+按不同并发级别向本地 app.py 服务发送 /convert 与 /convert-batch 请求，
+统计每个级别的吞吐量、延迟分位数、错误率与服务进程（含转换子进程）的峰值RSS，
+生成可在版本之间对比的容量曲线（JSON）。
+
+用法:
+    # 自动启动本地服务并测试
+    python load_test.py --start-server --concurrency 1,2,4,8 --duration 30 -o capacity.json
+
+    # 测试已运行的服务（提供PID以统计内存）
+    python load_test.py --url http://localhost:8000 --server-pid 12345
+
+    # 与上一版本的结果对比
+    python load_test.py --start-server -o capacity-new.json --compare capacity-old.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import fitz  # pymupdf
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def generate_pdf(page_count, seed=0):
+    """生成包含编号标题与正文的合成PDF，返回PDF字节"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        lines = [f"{page_num + 1}. Section {page_num + 1}"]
+        for sub in range(1, 4):
+            lines.append(f"{page_num + 1}.{sub} Subsection")
+            for _ in range(rng.randint(5, 10)):
+                lines.append("The results indicate a significant improvement over the baseline.")
+        page.insert_text((50, 60), "\n".join(lines), fontsize=9)
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def encode_multipart(files):
+    """
+    构造 multipart/form-data 请求体
+
+    参数:
+        files: [(字段名, 文件名, 内容bytes), ...]
+    返回:
+        (body, content_type)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, filename, content in files:
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode('utf-8')
+        )
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def post_files(url, files, timeout):
+    """发送上传请求，返回 (是否成功, 延迟秒数, 错误信息)"""
+    body, content_type = encode_multipart(files)
+    request = urllib.request.Request(url, data=body, method='POST',
+                                     headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+        elapsed = time.perf_counter() - start
+        # 批量接口返回200但可能包含失败文件
+        if payload.get("failed"):
+            return False, elapsed, f"{payload['failed']} 个文件转换失败"
+        return True, elapsed, None
+    except urllib.error.HTTPError as e:
+        return False, time.perf_counter() - start, f"HTTP {e.code}"
+    except Exception as e:
+        return False, time.perf_counter() - start, type(e).__name__
+
+
+def process_tree_rss(pid):
+    """返回进程及其全部子进程的RSS之和（字节），无法获取时返回None"""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            total = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.NoSuchProcess:
+                    pass
+            return total
+        except psutil.NoSuchProcess:
+            return None
+
+    # 无 psutil 时读取 /proc（Linux）
+    total = 0
+    pending = [pid]
+    found = False
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        found = True
+                        break
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total if found else None
+
+
+class RssSampler:
+    """后台线程定时采样服务进程树的RSS，记录峰值"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            rss = process_tree_rss(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            self._stop_event.wait(self.interval)
+
+    def __enter__(self):
+        if self.pid is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def percentile(sorted_values, fraction):
+    """计算分位数（最近秩法）"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def run_level(base_url, concurrency, duration, corpus, batch_ratio, batch_size, timeout, server_pid, seed):
+    """以指定并发运行一个级别，返回统计结果"""
+    rng_lock = threading.Lock()
+    rng = random.Random(seed)
+    deadline = time.monotonic() + duration
+    records = []
+    records_lock = threading.Lock()
+
+    def worker():
+        while time.monotonic() < deadline:
+            with rng_lock:
+                use_batch = rng.random() < batch_ratio
+                picks = [rng.choice(corpus) for _ in range(batch_size if use_batch else 1)]
+            if use_batch:
+                files = [("files", name, content) for name, content, _ in picks]
+                ok, elapsed, error = post_files(f"{base_url}/convert-batch", files, timeout)
+            else:
+                name, content, _ = picks[0]
+                ok, elapsed, error = post_files(f"{base_url}/convert", [("file", name, content)], timeout)
+            with records_lock:
+                records.append({
+                    "endpoint": "batch" if use_batch else "convert",
+                    "ok": ok,
+                    "seconds": elapsed,
+                    "files": len(picks),
+                    "pages": sum(pages for _, _, pages in picks),
+                    "error": error,
+                })
+
+    start = time.monotonic()
+    with RssSampler(server_pid) as sampler:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+    wall = time.monotonic() - start
+
+    latencies = sorted(item["seconds"] for item in records)
+    succeeded = [item for item in records if item["ok"]]
+    errors = {}
+    for item in records:
+        if item["error"]:
+            errors[item["error"]] = errors.get(item["error"], 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(records),
+        "successful": len(succeeded),
+        "error_rate": (len(records) - len(succeeded)) / len(records) if records else 0.0,
+        "errors": errors,
+        "throughput_rps": len(succeeded) / wall,
+        "files_per_second": sum(item["files"] for item in succeeded) / wall,
+        "pages_per_second": sum(item["pages"] for item in succeeded) / wall,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p90": percentile(latencies, 0.90),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": latencies[-1] if latencies else None,
+        "peak_rss_bytes": sampler.peak,
+    }
+
+
+def start_server(port):
+    """在子进程中启动 app.py 服务，等待其可用后返回进程对象"""
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    code = f"import uvicorn, app; uvicorn.run(app.app, host='127.0.0.1', port={port}, log_level='warning')"
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=app_dir)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError("服务启动失败")
+        try:
+            urllib.request.urlopen(f"{url}/metrics", timeout=1).read()
+            return process, url
+        except Exception:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("服务启动超时")
+
+
+def git_revision():
+    """当前代码版本（git describe），用于标记容量曲线"""
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def format_bytes(value):
+    return "-" if value is None else f"{value / 1024 / 1024:.0f}MB"
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_levels(levels):
+    """打印容量曲线表格"""
+    print(f"{'并发':>6}{'请求数':>8}{'请求/秒':>10}{'页/秒':>10}{'P50':>10}{'P90':>10}{'P99':>10}{'错误率':>8}{'峰值RSS':>10}")
+    for item in levels:
+        print(
+            f"{item['concurrency']:>6}{item['requests']:>8}{item['throughput_rps']:>10.2f}"
+            f"{item['pages_per_second']:>10.1f}{format_seconds(item['latency_p50']):>10}"
+            f"{format_seconds(item['latency_p90']):>10}{format_seconds(item['latency_p99']):>10}"
+            f"{item['error_rate'] * 100:>7.1f}%{format_bytes(item['peak_rss_bytes']):>10}"
+        )
+
+
+def print_comparison(current, baseline):
+    """与基线结果逐级别对比吞吐量与P99延迟"""
+    print(f"\n与基线对比（{baseline.get('revision') or '未知版本'} → {current.get('revision') or '当前'}）:")
+    baseline_levels = {item["concurrency"]: item for item in baseline["levels"]}
+    print(f"{'并发':>6}{'请求/秒变化':>14}{'P99变化':>12}{'峰值RSS变化':>14}")
+    for item in current["levels"]:
+        old = baseline_levels.get(item["concurrency"])
+        if old is None:
+            continue
+
+        def change(new_value, old_value):
+            if not new_value or not old_value:
+                return "-"
+            return f"{(new_value - old_value) / old_value * 100:+.1f}%"
+
+        print(
+            f"{item['concurrency']:>6}{change(item['throughput_rps'], old['throughput_rps']):>14}"
+            f"{change(item['latency_p99'], old['latency_p99']):>12}"
+            f"{change(item['peak_rss_bytes'], old['peak_rss_bytes']):>14}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDFMark Web服务压力测试")
+    parser.add_argument("--url", default="http://localhost:8000", help="服务地址")
+    parser.add_argument("--start-server", action="store_true", help="自动启动本地 app.py 服务")
+    parser.add_argument("--port", type=int, default=8765, help="自动启动服务时使用的端口")
+    parser.add_argument("--server-pid", type=int, default=None, help="服务进程PID，用于统计峰值RSS")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="并发级别，逗号分隔")
+    parser.add_argument("--duration", type=float, default=30, help="每个并发级别的持续时间（秒）")
+    parser.add_argument("--pages", default="1,10,50", help="合成PDF的页数，逗号分隔，请求时随机选取")
+    parser.add_argument("--batch-ratio", type=float, default=0.2, help="/convert-batch 请求所占比例")
+    parser.add_argument("--batch-size", type=int, default=5, help="每个批量请求包含的文件数")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("-o", "--output", default=None, help="容量曲线JSON输出路径")
+    parser.add_argument("--compare", default=None, help="用于对比的基线容量曲线JSON")
+    args = parser.parse_args()
+
+    concurrency_levels = [int(value) for value in args.concurrency.split(',') if value.strip()]
+    page_counts = [int(value) for value in args.pages.split(',') if value.strip()]
+
+    print("生成合成PDF...")
+    corpus = [(f"synthetic_{pages}p.pdf", generate_pdf(pages, args.seed + pages), pages) for pages in page_counts]
+
+    server = None
+    base_url = args.url.rstrip('/')
+    server_pid = args.server_pid
+    if args.start_server:
+        server, base_url = start_server(args.port)
+        server_pid = server.pid
+        print(f"已启动服务: {base_url} (PID {server_pid})")
+
+    try:
+        levels = []
+        for concurrency in concurrency_levels:
+            print(f"并发 {concurrency}，持续 {args.duration:.0f} 秒...")
+            levels.append(run_level(
+                base_url, concurrency, args.duration, corpus, args.batch_ratio,
+                args.batch_size, args.timeout, server_pid, args.seed + concurrency
+            ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    result = {
+        "revision": git_revision(),
+        "time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "config": {
+            "duration": args.duration,
+            "pages": page_counts,
+            "batch_ratio": args.batch_ratio,
+            "batch_size": args.batch_size,
+        },
+        "levels": levels,
+    }
+
+    print()
+    print_levels(levels)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n容量曲线已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
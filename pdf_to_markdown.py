@@ -9,56 +9,120 @@ import PyPDF2
 import fitz  # pymupdf
 import re
 import os
+import time
+import argparse
+from array import array
+from itertools import accumulate, islice
 from pathlib import Path
 
-def extract_text_with_pymupdf(pdf_path):
-    """使用PyMuPDF提取PDF文本，保留更好的格式"""
+from heading_rules import resolve_matcher
+
+def extract_text_with_pymupdf(pdf_path, profiler=None):
+    """使用PyMuPDF提取PDF文本，保留更好的格式（profiler 不为空时记录每页耗时）"""
     doc = fitz.open(pdf_path)
     full_text = ""
     
     for page_num in range(len(doc)):
+        if profiler is not None:
+            page_start = time.perf_counter()
         page = doc.load_page(page_num)
         text = page.get_text()
         full_text += f"\n<!-- 第{page_num + 1}页 -->\n"
         full_text += text + "\n"
+        if profiler is not None:
+            profiler.record_page(page_num + 1, time.perf_counter() - page_start, len(text))
     
     doc.close()
     return full_text
 
-def detect_headings(text):
-    """检测标题层级"""
-    lines = text.split('\n')
-    processed_lines = []
-    
-    for line in lines:  # 修复：移除错误的 .strip()
-        if not line.strip():
-            processed_lines.append(line)
-            continue
-            
-        # 检测数字编号标题 (如: 1. 2.1 3.2.1)
-        if re.match(r'^\d+(\.\d+)*\.?\s+', line):
-            level = line.count('.') + 1
-            if level > 6:
-                level = 6
-            heading = '#' * level + ' ' + line
-            processed_lines.append(heading)
-        
-        # 检测中文编号 (如: 一、二、三、)
-        elif re.match(r'^[一二三四五六七八九十]+、', line):
-            processed_lines.append('# ' + line)
-        
-        # 检测括号编号 (如: (1) (2) (一) (二))
-        elif re.match(r'^\([一二三四五六七八九十\d]+\)', line):
-            processed_lines.append('## ' + line)
+class LineIndex:
+    """
+    紧凑的行表示，供标题检测等后处理阶段使用
+    - text: 所有行共享的文本缓冲区，不为每行长期保存字符串
+    - offsets: 每行起始偏移（array，末尾附加哨兵）
+    - levels: 每行标题层级（bytearray，每行1字节，0表示非标题）
+    - headings: 标题行的行号（array），渲染时只需处理这些行
+    文本按块拆分并逐块判断标题，临时字符串只在块内存在；标题前缀只在 render() 时写入输出。
+    rules 为标题规则包（见 heading_rules.resolve_matcher），默认根据文本自动选择。
+    """
+    
+    CHUNK_CHARS = 1 << 20
+    
+    def __init__(self, text, rules=None):
+        self.text = text
+        self.matcher = resolve_matcher(rules, text)
+        self.offsets = array('q', [0])
+        self.levels = bytearray()
+        self.headings = array('I')
         
-        # 检测全大写或加粗标题特征
-        elif len(line) < 50 and (line.isupper() or '第' in line and '章' in line):
-            processed_lines.append('# ' + line)
+        pos = 0
+        while True:
+            cut = text.find('\n', pos + self.CHUNK_CHARS)
+            chunk = text[pos:] if cut == -1 else text[pos:cut]
+            self._add_lines(chunk.split('\n'))
+            if cut == -1:
+                break
+            pos = cut + 1
+    
+    def _add_lines(self, lines):
+        """追加一个块的行：记录偏移并判断标题层级"""
+        base = len(self.levels)
+        self.offsets.extend(islice(accumulate(map(len, lines), lambda total, n: total + n + 1,
+                                              initial=self.offsets[-1]), 1, None))
+        self.levels.extend(bytes(len(lines)))
         
-        else:
-            processed_lines.append(line)
+        levels = self.levels
+        headings = self.headings
+        # 行首字符没有对应规则的行只可能命中兜底规则，先用长度和 isupper() 过滤，减少匹配器调用
+        first_chars = self.matcher.first_chars
+        fallback_max_length = self.matcher.fallback_max_length
+        fallback_upper_only = self.matcher.fallback_upper_only
+        heading_level = self.matcher.level
+        for i, line in enumerate(lines, base):
+            if not line:
+                continue
+            if line[0] not in first_chars and (
+                len(line) > fallback_max_length or fallback_upper_only and not line.isupper()
+            ):
+                continue
+            level = heading_level(line)
+            if level:
+                levels[i] = level
+                headings.append(i)
+    
+    def __len__(self):
+        return len(self.levels)
+    
+    def line(self, i):
+        """返回第 i 行文本（不含换行符）"""
+        return self.text[self.offsets[i]:self.offsets[i + 1] - 1]
+    
+    def render(self):
+        """输出带Markdown标题前缀的文本，非标题行按整段复制"""
+        text = self.text
+        offsets = self.offsets
+        levels = self.levels
+        parts = []
+        prev = 0
+        for i in self.headings:
+            start = offsets[i]
+            parts.append(text[prev:start])
+            parts.append('#' * levels[i] + ' ')
+            prev = start
+        parts.append(text[prev:])
+        return ''.join(parts)
+
+def detect_headings(text, profiler=None, rules=None):
+    """检测标题层级（profiler 不为空时记录处理的行数；rules 为标题规则包，默认自动选择）"""
+    if profiler is not None:
+        start = time.perf_counter()
+    
+    index = LineIndex(text, rules)
+    
+    if profiler is not None:
+        profiler.record_headings(len(index), len(index.headings), time.perf_counter() - start)
     
-    return '\n'.join(processed_lines)
+    return index.render()
 
 def clean_markdown(text):
     """清理和优化Markdown格式"""
@@ -75,27 +139,45 @@ def clean_markdown(text):
     
     return text
 
-def pdf_to_markdown(pdf_path, output_path=None):
-    """主函数：PDF转Markdown"""
+def pdf_to_markdown(pdf_path, output_path=None, profile=False, formats=None, rules=None):
+    """
+    主函数：PDF转Markdown
+
+    参数:
+        pdf_path: PDF文件路径
+        output_path: 输出路径，默认与PDF同名的 .md 文件
+        profile: 是否开启性能分析，开启后在输出文件旁写入 .profile.json / .folded / .prof
+        formats: 输出格式列表（见 document_tree.RENDERERS），默认只输出 markdown；
+                 其他格式写入与 output_path 同名、扩展名不同的文件
+        rules: 标题规则包，如 "zh,legal"（见 heading_rules.RULE_PACKS），默认根据文本自动选择
+    """
     if not os.path.exists(pdf_path):
         print(f"错误：文件 {pdf_path} 不存在")
         return False
     
     print(f"正在处理: {pdf_path}")
     
+    profiler = None
+    if profile:
+        from profiling import ConversionProfiler
+        profiler = ConversionProfiler()
+        profiler.start()
+    
     try:
-        # 提取文本
-        text = extract_text_with_pymupdf(pdf_path)
-        
-        if not text.strip():
-            print("警告：未能提取到文本内容")
-            return False
-        
-        # 检测和转换标题
-        markdown_text = detect_headings(text)
-        
-        # 清理格式
-        markdown_text = clean_markdown(markdown_text)
+        try:
+            # 提取文本
+            text = extract_text_with_pymupdf(pdf_path, profiler)
+            
+            if not text.strip():
+                print("警告：未能提取到文本内容")
+                return False
+            
+            # 检测标题并输出各格式，多种格式共用一次标题检测
+            from document_tree import render_document
+            outputs = render_document(text, formats or ["markdown"], Path(pdf_path).stem, rules, profiler)
+        finally:
+            if profiler is not None:
+                profiler.stop()
         
         # 添加文档头部
         pdf_name = Path(pdf_path).stem
@@ -109,17 +191,28 @@ def pdf_to_markdown(pdf_path, output_path=None):
 
 """
         
-        markdown_text = header + markdown_text
-        
         # 确定输出路径
         if output_path is None:
             output_path = pdf_path.replace('.pdf', '.md')
         
         # 保存文件
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(markdown_text)
+        for name, body in outputs.items():
+            if name == "markdown":
+                path = output_path
+                body = header + body
+            else:
+                from document_tree import RENDERERS
+                path = os.path.splitext(output_path)[0] + RENDERERS[name][1]
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(body)
+            print(f"转换完成！输出文件: {path}")
+        
+        # 写入性能分析报告
+        if profiler is not None:
+            from profiling import write_profile_report
+            report_paths = write_profile_report(profiler.report(), os.path.splitext(output_path)[0])
+            print(f"性能分析报告: {', '.join(report_paths)}")
         
-        print(f"转换完成！输出文件: {output_path}")
         return True
         
     except Exception as e:
@@ -129,17 +222,45 @@ def pdf_to_markdown(pdf_path, output_path=None):
 if __name__ == "__main__":
     import pandas as pd
     
+    parser = argparse.ArgumentParser(description="PDF转Markdown")
+    parser.add_argument("pdf_file", nargs="?",
+                        default="附件1南京农业大学研究生学位论文格式规范（自然科学类）.pdf",
+                        help="目标PDF文件")
+    parser.add_argument("-o", "--output", default=None, help="输出Markdown文件路径")
+    parser.add_argument("-f", "--formats", default=None,
+                        help="输出格式，逗号分隔：markdown,html,json,text（默认 markdown）")
+    parser.add_argument("--profile", action="store_true",
+                        help="开启性能分析，在输出文件旁生成 .profile.json / .folded / .prof")
+    parser.add_argument("-r", "--rules", default=None,
+                        help="标题规则包，逗号分隔：zh,en,legal,academic（默认根据文本自动选择）")
+    args = parser.parse_args()
+    
+    formats = None
+    if args.formats:
+        from document_tree import parse_formats
+        try:
+            formats = parse_formats(args.formats)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    from heading_rules import parse_rule_packs
+    try:
+        rules = parse_rule_packs(args.rules)
+    except ValueError as e:
+        parser.error(str(e))
+    
     # 目标PDF文件
-    pdf_file = "附件1南京农业大学研究生学位论文格式规范（自然科学类）.pdf"
+    pdf_file = args.pdf_file
+    output_file = args.output or pdf_file.replace('.pdf', '.md')
     
     # 检查文件是否存在
     if os.path.exists(pdf_file):
         # 执行转换
-        success = pdf_to_markdown(pdf_file)
+        success = pdf_to_markdown(pdf_file, output_file, profile=args.profile, formats=formats, rules=rules)
         
         if success:
             print("\n✅ PDF转Markdown完成！")
-            print(f"📄 输出文件: {pdf_file.replace('.pdf', '.md')}")
+            print(f"📄 输出文件: {output_file}")
         else:
             print("\n❌ 转换失败，请检查错误信息")
     else:
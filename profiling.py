@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转换性能分析
+按需开启，用于定位个别PDF转换异常缓慢的原因。开启后记录：
+- cProfile 函数级统计（.prof，可用 snakeviz / pstats 查看）
+- 采样得到的调用栈（.folded，折叠栈格式，可直接用于 flamegraph.pl / speedscope）
+- 每页提取耗时与字符数、标题检测处理的行数（.profile.json）
+未开启时转换流程只多一次 `profiler is not None` 判断，不产生额外开销。
+"""
+
+import cProfile
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from storage import atomic_write
+
+
+class ConversionProfiler:
+    """单次转换的性能分析器"""
+
+    def __init__(self, sample_interval=0.005):
+        self.sample_interval = sample_interval
+        self.page_timings = []
+        self.heading_stats = []
+        self.total_seconds = None
+
+        self._profile = cProfile.Profile()
+        self._samples = Counter()
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._target_thread_id = None
+        self._start_time = None
+
+    def start(self):
+        """开始分析（在执行转换的线程中调用）"""
+        self._target_thread_id = threading.get_ident()
+        self._stop_event.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+        self._start_time = time.perf_counter()
+        self._profile.enable()
+
+    def stop(self):
+        """结束分析"""
+        self._profile.disable()
+        self.total_seconds = time.perf_counter() - self._start_time
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+
+    def _sample_loop(self):
+        """定时采样目标线程的调用栈"""
+        while not self._stop_event.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self._samples[";".join(reversed(stack))] += 1
+
+    def record_page(self, page_number, seconds, chars):
+        """记录单页提取耗时"""
+        self.page_timings.append({
+            "page": page_number,
+            "seconds": round(seconds, 6),
+            "chars": chars,
+        })
+
+    def record_headings(self, total_lines, heading_lines, seconds):
+        """记录一次标题检测处理的行数"""
+        self.heading_stats.append({
+            "total_lines": total_lines,
+            "heading_lines": heading_lines,
+            "seconds": round(seconds, 6),
+        })
+
+    def report(self):
+        """
+        生成可序列化的分析结果（可跨进程传递）
+
+        返回:
+            dict，包含 summary（JSON报告）、folded（折叠栈文本）、pstats（cProfile统计的marshal数据）
+        """
+        self._profile.create_stats()
+        slowest = sorted(self.page_timings, key=lambda item: item["seconds"], reverse=True)[:10]
+        summary = {
+            "total_seconds": round(self.total_seconds or 0.0, 6),
+            "page_count": len(self.page_timings),
+            "extract_seconds": round(sum(item["seconds"] for item in self.page_timings), 6),
+            "slowest_pages": slowest,
+            "pages": self.page_timings,
+            "detect_headings": self.heading_stats,
+            "sample_interval": self.sample_interval,
+            "sample_count": sum(self._samples.values()),
+        }
+        folded = "".join(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+        return {
+            "summary": summary,
+            "folded": folded,
+            "pstats": marshal.dumps(self._profile.stats),
+        }
+
+
+def write_profile_report(report, base_path):
+    """
+    将分析结果写入 base_path 对应的文件
+
+    参数:
+        report: ConversionProfiler.report() 的返回值
+        base_path: 不含扩展名的路径，如 "outputs/论文"
+    返回:
+        写入的文件路径列表：.profile.json、.folded、.prof
+    """
+    paths = [f"{base_path}.profile.json", f"{base_path}.folded", f"{base_path}.prof"]
+    atomic_write(paths[0], json.dumps(report["summary"], ensure_ascii=False, indent=2))
+    atomic_write(paths[1], report["folded"])
+    atomic_write(paths[2], report["pstats"])
+    return paths
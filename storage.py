@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转换任务的文件存储层
+- 每个任务使用独立的上传目录，避免同名文件并发冲突
+- 所有写入均为原子写入（临时文件 + 重命名），读取方不会看到半写入的文件
+- 输出文件按内容寻址，相同的转换结果只存储一份
+- 后台清理线程按过期时间（TTL）和磁盘配额回收空间
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# 输出文件ID：各格式的转换结果及性能分析报告（见 document_tree.py / profiling.py）
+# 转换结果为 <sha256>.<扩展名>；性能分析报告附加任务ID，为 <sha256>.<任务ID>.<报告扩展名>
+OUTPUT_ID_PATTERN = re.compile(
+    r'^[0-9a-f]{64}(\.md|\.html|\.json|\.txt|\.[0-9a-f]{32}(\.profile\.json|\.folded|\.prof))$'
+)
+
+
+def atomic_write(path, data):
+    """
+    原子写入文件：先写入同目录下的临时文件，再重命名为目标文件
+
+    参数:
+        path: 目标文件路径
+        data: bytes 或 str（str 按 UTF-8 编码）
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ConversionStorage:
+    """上传文件与转换结果的存储管理"""
+
+    def __init__(self, upload_dir="uploads", output_dir="outputs"):
+        self.upload_dir = upload_dir
+        self.output_dir = output_dir
+        self.jobs_dir = os.path.join(upload_dir, "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def create_job_dir(self):
+        """为一次转换任务创建唯一的临时目录"""
+        job_dir = os.path.join(self.jobs_dir, uuid.uuid4().hex)
+        os.makedirs(job_dir)
+        return job_dir
+
+    def save_upload(self, content):
+        """
+        将上传内容保存到新的任务目录
+
+        返回:
+            (job_dir, upload_path)
+        """
+        job_dir = self.create_job_dir()
+        upload_path = os.path.join(job_dir, "input.pdf")
+        atomic_write(upload_path, content)
+        return job_dir, upload_path
+
+    def remove_job_dir(self, job_dir):
+        """删除任务目录及其中的文件"""
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    def store_output(self, body, extension=".md"):
+        """
+        按内容寻址保存转换结果
+
+        文件名为转换正文的sha256，正文相同的结果只写入一次；
+        已存在时仅刷新修改时间，延长其保留期。文件只保存正文，
+        标题、原文件名、转换时间等每次请求不同的信息不写入文件（见 app.download_file）。
+
+        参数:
+            body: 转换得到的正文
+            extension: 文件扩展名，如 ".md" ".html"
+        返回:
+            输出文件ID（形如 "<sha256>.md"）
+        """
+        digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        output_id = f"{digest}{extension}"
+        output_path = os.path.join(self.output_dir, output_id)
+
+        if os.path.exists(output_path):
+            try:
+                os.utime(output_path)
+                return output_id
+            except FileNotFoundError:
+                # 恰好被清理线程删除，重新写入
+                pass
+
+        atomic_write(output_path, body)
+        return output_id
+
+    def output_path(self, output_id):
+        """返回输出文件路径，ID不合法时返回None"""
+        if not OUTPUT_ID_PATTERN.match(output_id):
+            return None
+        return os.path.join(self.output_dir, output_id)
+
+
+def _collect_files(directory):
+    """递归列出目录下的文件，返回 (path, mtime, size) 列表"""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((path, st.st_mtime, st.st_size))
+    return files
+
+
+def sweep_directory(directory, ttl_seconds=None, max_bytes=None, now=None):
+    """
+    清理目录：删除超过TTL的文件，再按修改时间从旧到新删除直至不超过配额
+
+    参数:
+        directory: 待清理目录
+        ttl_seconds: 文件最长保留时间（秒），None 表示不限
+        max_bytes: 目录总大小上限（字节），None 表示不限
+        now: 当前时间戳，默认 time.time()
+    返回:
+        (删除文件数, 释放字节数)
+    """
+    if not os.path.isdir(directory):
+        return 0, 0
+    if now is None:
+        now = time.time()
+
+    removed = 0
+    freed = 0
+    kept = []
+    for path, mtime, size in _collect_files(directory):
+        if ttl_seconds is not None and now - mtime > ttl_seconds:
+            try:
+                os.remove(path)
+                removed += 1
+                freed += size
+            except FileNotFoundError:
+                pass
+        else:
+            kept.append((path, mtime, size))
+
+    if max_bytes is not None:
+        total = sum(size for _, _, size in kept)
+        kept.sort(key=lambda item: item[1])
+        for path, _, size in kept:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                freed += size
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # 删除过期的空目录（保留根目录；未过期的空目录可能是刚创建的任务目录）
+    if ttl_seconds is not None:
+        for root, dirs, _ in os.walk(directory, topdown=False):
+            for name in dirs:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.stat(path).st_mtime > ttl_seconds:
+                        os.rmdir(path)
+                except OSError:
+                    pass
+
+    return removed, freed
+
+
+class StorageSweeper:
+    """后台清理线程，定期对若干目录执行 sweep_directory"""
+
+    def __init__(self, targets, interval_seconds=600):
+        """
+        参数:
+            targets: [(directory, ttl_seconds, max_bytes), ...]
+            interval_seconds: 清理间隔（秒）
+        """
+        self.targets = targets
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def sweep_once(self):
+        """立即执行一次清理"""
+        removed = 0
+        freed = 0
+        for directory, ttl_seconds, max_bytes in self.targets:
+            count, size = sweep_directory(directory, ttl_seconds, max_bytes)
+            removed += count
+            freed += size
+        return removed, freed
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.sweep_once()
+            except Exception as e:
+                print(f"存储清理出错: {str(e)}")
+            self._stop_event.wait(self.interval_seconds)
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
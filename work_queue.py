@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式批量转换
+协调者将PDF路径写入共享的SQLite任务队列，任意数量、任意主机上的工作进程领取任务（租约），
+通过现有转换流程（带资源限制的子进程）完成转换并记录结果。
+- 工作进程在转换期间定时心跳续租
+- 工作进程崩溃后租约过期，任务被其他工作进程重新领取，超过最大尝试次数后标记为失败
+- 触发资源限制、无法打开或无法提取文本的任务不重试
+- 续租失败（租约已被其他工作进程接管）时放弃当前任务，不写入输出文件
+
+用法:
+    # 协调者：加入任务（目录会递归查找PDF）
+    python work_queue.py enqueue --db queue.db --output-dir outputs_md archive/
+
+    # 工作进程：可在多台主机上分别运行（数据库需位于共享存储）
+    python work_queue.py worker --db queue.db --processes 4
+
+    # 查看进度
+    python work_queue.py status --db queue.db
+
+注意：SQLite 依赖文件锁，多主机共享时应放在支持 POSIX 锁的共享文件系统上。
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from conversion_limits import (
+    ConversionLimits, ConversionLimitExceeded, InvalidPDFError, NoTextError, convert_with_limits
+)
+from storage import atomic_write
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pdf_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker_id TEXT,
+    lease_expires REAL,
+    error TEXT,
+    duration REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, lease_expires);
+"""
+
+# 任务状态
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# 续租失败（如数据库被锁）后的重试间隔（秒）
+HEARTBEAT_RETRY_SECONDS = 1.0
+
+
+class LeaseLostError(Exception):
+    """任务租约已失效，输出文件可能由其他工作进程写入"""
+
+
+class WorkQueue:
+    """基于SQLite的任务队列"""
+
+    def __init__(self, db_path, timeout=30):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, pdf_paths, output_paths, max_attempts=3):
+        """
+        加入任务，已在等待或处理中的相同PDF不会重复加入
+
+        返回:
+            新加入的任务数
+        """
+        now = time.time()
+        added = 0
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for pdf_path, output_path in zip(pdf_paths, output_paths):
+                    exists = self.conn.execute(
+                        "SELECT 1 FROM jobs WHERE pdf_path = ? AND status IN (?, ?)",
+                        (pdf_path, PENDING, LEASED),
+                    ).fetchone()
+                    if exists:
+                        continue
+                    self.conn.execute(
+                        "INSERT INTO jobs (pdf_path, output_path, max_attempts, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (pdf_path, output_path, max_attempts, now, now),
+                    )
+                    added += 1
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def lease(self, worker_id, lease_seconds):
+        """
+        领取一个任务：等待中的任务，或租约已过期的任务
+
+        返回:
+            任务行（sqlite3.Row），没有可领取的任务时返回None
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 租约过期且已用完尝试次数的任务直接标记为失败
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+                    "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                    (FAILED, "租约过期且超过最大尝试次数", now, LEASED, now),
+                )
+                row = self.conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (PENDING, LEASED, now),
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (LEASED, worker_id, now + lease_seconds, now, row["id"]),
+                )
+                job = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self.conn.execute("COMMIT")
+                return job
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id, worker_id, lease_seconds):
+        """续租，返回是否仍持有该任务"""
+        now = time.time()
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (now + lease_seconds, now, job_id, worker_id, LEASED),
+            )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id, worker_id, duration):
+        """标记任务完成，返回是否仍持有该任务"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, duration = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (DONE, duration, time.time(), job_id, worker_id, LEASED),
+            )
+        return cursor.rowcount > 0
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        """
+        记录任务失败：允许重试且未用完尝试次数时放回队列，否则标记为失败
+        """
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < max_attempts THEN ? ELSE ? END, "
+                "error = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (1 if retry else 0, PENDING, FAILED, error, time.time(), job_id, worker_id, LEASED),
+            )
+        return cursor.rowcount > 0
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def failed_jobs(self, limit=20):
+        """最近失败的任务"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, pdf_path, attempts, error FROM jobs WHERE status = ? "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (FAILED, limit),
+            ).fetchall()
+
+
+def find_pdfs(paths):
+    """展开路径列表，目录递归查找PDF文件"""
+    pdf_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdf_paths.extend(sorted(str(p) for p in Path(path).rglob("*.pdf")))
+        elif path.lower().endswith(".pdf"):
+            pdf_paths.append(path)
+    return [os.path.abspath(p) for p in pdf_paths]
+
+
+def output_path_for(pdf_path, output_dir=None, root=None):
+    """确定输出路径：默认与PDF同目录；指定输出目录时保留相对 root 的目录结构"""
+    if output_dir is None:
+        return os.path.splitext(pdf_path)[0] + ".md"
+    relative = os.path.relpath(pdf_path, root) if root else os.path.basename(pdf_path)
+    return os.path.abspath(os.path.join(output_dir, os.path.splitext(relative)[0] + ".md"))
+
+
+def convert_job(job, limits, holds_lease=None):
+    """
+    通过现有转换流程转换单个任务并写入输出文件
+
+    holds_lease: 写入前调用，返回 False 时不写入并抛出 LeaseLostError
+    """
+    pdf_path = job["pdf_path"]
+    result = convert_with_limits(pdf_path, limits, pdf_path)
+    if holds_lease is not None and not holds_lease():
+        raise LeaseLostError("租约已失效，放弃写入输出文件")
+    pdf_name = Path(pdf_path).stem
+    header = f"""# {pdf_name}
+
+> 本文档由PDF自动转换生成
+> 原文件：{pdf_path}
+> 转换时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+---
+
+"""
+    os.makedirs(os.path.dirname(job["output_path"]), exist_ok=True)
+    atomic_write(job["output_path"], header + result["outputs"]["markdown"])
+
+
+def run_worker(db_path, lease_seconds=60, poll_interval=2.0, exit_when_empty=False,
+               limits=None, worker_id=None):
+    """
+    工作进程主循环：领取任务、转换、心跳续租、记录结果
+
+    参数:
+        db_path: 队列数据库路径
+        lease_seconds: 租约时长，心跳间隔为其三分之一
+        poll_interval: 队列为空时的轮询间隔（秒）
+        exit_when_empty: 队列中没有可领取的任务时退出
+        limits: ConversionLimits
+        worker_id: 工作进程标识，默认为 主机名:PID:随机串
+    返回:
+        本进程完成的任务数
+    """
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    if limits is None:
+        limits = ConversionLimits()
+
+    queue = WorkQueue(db_path)
+    completed = 0
+    try:
+        while True:
+            job = queue.lease(worker_id, lease_seconds)
+            if job is None:
+                if exit_when_empty and queue.counts()[LEASED] == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            stop_heartbeat = threading.Event()
+            lease_lost = threading.Event()
+
+            def heartbeat(job_id=job["id"]):
+                interval = lease_seconds / 3
+                while not stop_heartbeat.wait(interval):
+                    try:
+                        if not queue.heartbeat(job_id, worker_id, lease_seconds):
+                            lease_lost.set()
+                            break
+                    except sqlite3.OperationalError as e:
+                        # 数据库被锁等错误不能让心跳线程退出，否则租约过期后任务会被其他工作进程重复领取
+                        print(f"⚠️  [{worker_id}] 续租失败，稍后重试: {e}")
+                        interval = min(HEARTBEAT_RETRY_SECONDS, lease_seconds / 3)
+                    else:
+                        interval = lease_seconds / 3
+
+            def holds_lease(job_id=job["id"]):
+                # 写入前再续租一次，确认租约在转换期间没有过期被其他工作进程领取
+                return not lease_lost.is_set() and queue.heartbeat(job_id, worker_id, lease_seconds)
+
+            heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+            heartbeat_thread.start()
+
+            start = time.monotonic()
+            try:
+                convert_job(job, limits, holds_lease)
+            except LeaseLostError as e:
+                # 任务已归其他工作进程，不再记录结果
+                print(f"⚠️  [{worker_id}] {job['pdf_path']}: {e}")
+            except (ConversionLimitExceeded, InvalidPDFError, NoTextError) as e:
+                queue.fail(job["id"], worker_id, str(e), retry=False)
+                print(f"❌ [{worker_id}] {job['pdf_path']}: {e}")
+            except Exception as e:
+                queue.fail(job["id"], worker_id, str(e), retry=True)
+                print(f"⚠️  [{worker_id}] {job['pdf_path']}: {e}")
+            else:
+                if queue.complete(job["id"], worker_id, time.monotonic() - start):
+                    completed += 1
+                    print(f"✅ [{worker_id}] {job['pdf_path']}")
+            finally:
+                stop_heartbeat.set()
+                heartbeat_thread.join()
+    finally:
+        queue.close()
+    return completed
+
+
+def _worker_process(db_path, lease_seconds, poll_interval, exit_when_empty):
+    """多进程模式下的子进程入口"""
+    run_worker(db_path, lease_seconds, poll_interval, exit_when_empty)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式批量PDF转Markdown")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="加入转换任务")
+    enqueue_parser.add_argument("--db", required=True, help="队列数据库路径")
+    enqueue_parser.add_argument("--output-dir", default=None, help="输出目录，默认与PDF同目录")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=3, help="每个任务最大尝试次数")
+    enqueue_parser.add_argument("paths", nargs="+", help="PDF文件或目录")
+
+    worker_parser = subparsers.add_parser("worker", help="运行工作进程")
+    worker_parser.add_argument("--db", required=True, help="队列数据库路径")
+    worker_parser.add_argument("--processes", type=int, default=1, help="本机工作进程数")
+    worker_parser.add_argument("--lease-seconds", type=float, default=60, help="租约时长（秒）")
+    worker_parser.add_argument("--poll-interval", type=float, default=2.0, help="空队列轮询间隔（秒）")
+    worker_parser.add_argument("--exit-when-empty", action="store_true", help="队列处理完后退出")
+
+    status_parser = subparsers.add_parser("status", help="查看队列进度")
+    status_parser.add_argument("--db", required=True, help="队列数据库路径")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        queue = WorkQueue(args.db)
+        added = 0
+        for path in args.paths:
+            root = path if os.path.isdir(path) else None
+            pdf_paths = find_pdfs([path])
+            output_paths = [output_path_for(p, args.output_dir, root) for p in pdf_paths]
+            added += queue.enqueue(pdf_paths, output_paths, args.max_attempts)
+        print(f"已加入 {added} 个任务")
+        queue.close()
+
+    elif args.command == "worker":
+        if args.processes <= 1:
+            count = run_worker(args.db, args.lease_seconds, args.poll_interval, args.exit_when_empty)
+            print(f"工作进程完成 {count} 个任务")
+        else:
+            processes = [
+                multiprocessing.Process(
+                    target=_worker_process,
+                    args=(args.db, args.lease_seconds, args.poll_interval, args.exit_when_empty),
+                )
+                for _ in range(args.processes)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+
+    elif args.command == "status":
+        queue = WorkQueue(args.db)
+        counts = queue.counts()
+        total = sum(counts.values())
+        print(f"共 {total} 个任务：等待 {counts[PENDING]}，处理中 {counts[LEASED]}，"
+              f"完成 {counts[DONE]}，失败 {counts[FAILED]}")
+        for row in queue.failed_jobs():
+            print(f"  ❌ #{row['id']} {row['pdf_path']}（尝试 {row['attempts']} 次）: {row['error']}")
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()